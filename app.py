@@ -1,13 +1,24 @@
 # -*- coding: utf-8 -*-
 import asyncio
+import logging
+import multiprocessing
 import subprocess
-import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
 
 import streamlit as st
-from markdown2 import markdown
-from weasyprint import CSS, HTML
 
-from graph.storm_graph import get_storm_graph
+import conf.config as config
+from clients import registry_scope
+from export.pdf import markdown_to_pdf
+from graph.storm_graph import (
+    ARTICLE_WRITER_TAG,
+    SECTION_WRITER_RUN_NAME,
+    get_storm_graph,
+)
+from metrics import MetricsCallbackHandler, start_metrics_server
+
+logger = logging.getLogger(__name__)
 
 
 def on_copy_click(text):
@@ -28,66 +39,144 @@ def on_copy_click(text):
         st.success("クリップボードにコピーしました")
 
 
-def create_pdf_from_markdown(markdown_text):
-    html_text = markdown(markdown_text, extras=["fenced-code-blocks"])
-    css = CSS(
-        string="""
-        @import url(https://fonts.googleapis.com/earlyaccess/notosansjp.css);
-        /* 全体のフォント設定（日本語対応） */
-        body {
-            font-family: 'Noto Sans JP', sans-serif;
-        }
-
-        /* コードブロックのスタイル設定 */
-        pre, code {
-            font-family: 'Courier New', Courier, monospace;
-            background-color: #f5f5f5;
-            padding: 10px;
-            border-radius: 5px;
-            overflow: auto;
-        }
-
-        /* PDF化を考慮したページの設定 */
-        @media print {
-            body {
-                font-size: 12pt;
-            }
-
-            pre, code {
-                font-size: 10pt;
-                white-space: pre-wrap;
-                word-wrap: break-word;
-            }
-
-            /* ページの余白設定 */
-            @page {
-                margin: 1in;
-            }
-        }
-
-        """
+@st.cache_resource
+def get_pdf_executor():
+    # WeasyPrint の描画は重いので別プロセスで行う（spawn なので export.pdf だけを読み込む）
+    return ProcessPoolExecutor(
+        max_workers=config.PDF_WORKERS, mp_context=multiprocessing.get_context("spawn")
+    )
+
+
+@st.cache_resource(show_spinner=False, max_entries=32)
+def start_pdf_render(markdown_text):
+    # 記事本文ごとに1回だけ描画を始め、同じ Future を返す（結果は待たない）
+    return get_pdf_executor().submit(
+        markdown_to_pdf, markdown_text, config.PDF_FONT_PATH
     )
 
-    # 一時ファイルに PDF を書き込む
-    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as temp_pdf:
-        HTML(string=html_text).write_pdf(temp_pdf.name, stylesheets=[css])
-        return temp_pdf.name
-
-
-async def generate_article(topic: str):
-    storm = get_storm_graph()
-    results = None
-    async for step in storm.astream(
-        {
-            "topic": topic,
-        }
-    ):
-        name = next(iter(step))
-        print(name)
-        print("-- ", str(step[name])[:300])
-        results = step
-
-    article = results["write_article"]["article"]
+
+@st.experimental_fragment(run_every=1)
+def wait_for_pdf(markdown_text):
+    # この部分だけを毎秒再実行し、描画が終わったらページ全体を再実行する
+    if start_pdf_render(markdown_text).done():
+        st.rerun()
+    st.caption("PDF を作成中です...")
+
+
+def show_pdf_download(future):
+    try:
+        pdf_data = future.result()
+    except Exception as e:
+        # 失敗した Future はキャッシュから外し、次の再実行でやり直す
+        start_pdf_render.clear()
+        if isinstance(e, FileNotFoundError):
+            st.error(str(e))
+        else:
+            logger.exception("PDF rendering failed")
+            st.error("PDF の作成に失敗しました。")
+        return
+    st.download_button(
+        label="Download PDF",
+        data=pdf_data,
+        file_name="article.pdf",
+        mime="application/pdf",
+    )
+
+
+STAGE_LABELS = {
+    "init_research": "初期アウトラインと編集者を作成中",
+    "conduct_interviews": "編集者がインタビュー中",
+    "refine_outline": "アウトラインを改善中",
+    "index_references": "参照文書を登録中",
+    "write_sections": "セクションを執筆中",
+    "write_article": "記事を仕上げ中",
+}
+
+
+class ProgressView:
+    """生成途中の結果（編集者・アウトライン・セクション・記事本文）を順に表示する"""
+
+    # 記事本文の再描画間隔（トークンごとに描画すると重い）
+    render_interval = 0.1
+
+    def __init__(self):
+        self.status = st.status("実行中です...", expanded=True)
+        self.editors = st.empty()
+        self.outline = st.empty()
+        self.sections = st.expander("セクション", expanded=False)
+        self.article = st.empty()
+        self._tokens = []
+        self._last_render = 0.0
+
+    def stage_started(self, name):
+        self.status.update(label=STAGE_LABELS[name] + "...")
+        self.status.write(STAGE_LABELS[name])
+
+    def stage_finished(self, name, output):
+        if name == "init_research":
+            with self.editors.expander("編集者", expanded=True):
+                for editor in output["editors"]:
+                    st.markdown(
+                        f"**{editor.name}** ({editor.affiliation}): {editor.role}"
+                    )
+            self.show_outline(output["outline"])
+        elif name == "refine_outline":
+            self.show_outline(output["outline"])
+
+    def show_outline(self, outline):
+        with self.outline.expander("アウトライン", expanded=True):
+            st.markdown(outline.as_str)
+
+    def section_written(self, section):
+        self.sections.markdown(section.as_str)
+
+    def article_token(self, token):
+        self._tokens.append(token)
+        now = time.monotonic()
+        if now - self._last_render >= self.render_interval:
+            self._last_render = now
+            self.article.markdown("".join(self._tokens))
+
+    def finish(self, article):
+        self.article.markdown(article)
+        self.status.update(label="完了しました", state="complete", expanded=False)
+
+
+async def generate_article(topic: str, view: ProgressView = None):
+    async with registry_scope():
+        storm = get_storm_graph()
+        article = None
+        async for event in storm.astream_events(
+            {
+                "topic": topic,
+            },
+            {"callbacks": [MetricsCallbackHandler()]},
+            version="v2",
+            include_names=[*STAGE_LABELS, SECTION_WRITER_RUN_NAME],
+            include_tags=[ARTICLE_WRITER_TAG],
+        ):
+            kind, name = event["event"], event["name"]
+            if kind == "on_chain_start" and name in STAGE_LABELS:
+                logger.info(name)
+                if view:
+                    view.stage_started(name)
+            elif kind == "on_chain_end" and name in STAGE_LABELS:
+                output = event["data"]["output"]
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("-- %s", str(output)[:300])
+                if name == "write_article":
+                    article = output["article"]
+                if view:
+                    view.stage_finished(name, output)
+            elif kind == "on_chain_end" and name == SECTION_WRITER_RUN_NAME:
+                if view:
+                    view.section_written(event["data"]["output"])
+            elif kind == "on_chat_model_stream" and ARTICLE_WRITER_TAG in event["tags"]:
+                if view:
+                    view.article_token(event["data"]["chunk"].content)
+
+    if view:
+        view.finish(article)
     return article
 
 
@@ -99,11 +188,13 @@ def input_topic_page():
         if not topic:
             st.warning("トピックを入力してください")
         else:
-            with st.spinner("実行中です..."):
-                article = asyncio.run(generate_article(topic))
-                st.session_state["article"] = article
-                st.session_state["page_control"] = 1
-                st.rerun()
+            article = asyncio.run(generate_article(topic, ProgressView()))
+            if article:
+                # 結果ページへの切り替えと並行して PDF を描画しておく
+                start_pdf_render(article)
+            st.session_state["article"] = article
+            st.session_state["page_control"] = 1
+            st.rerun()
 
 
 def download_pdf_page():
@@ -119,21 +210,25 @@ def download_pdf_page():
             st.button("📋", on_click=on_copy_click, args=(article,))
         # container.markdown(article)
 
-        pdf_path = create_pdf_from_markdown(article)
-        with open(pdf_path, "rb") as pdf_file:
-            pdf_data = pdf_file.read()
-
-        st.download_button(
-            label="Download PDF",
-            data=pdf_data,
-            file_name="article.pdf",
-            mime="application/pdf",
-        )
+        future = start_pdf_render(article)
+        if future.done():
+            show_pdf_download(future)
+        else:
+            wait_for_pdf(article)
     else:
         st.error("記事が作成できませんでした。もう一度試してください。")
 
 
+@st.cache_resource
+def start_monitoring():
+    # Streamlit はクリックのたびにスクリプトを再実行するので一度だけ起動する
+    logging.basicConfig(level=config.LOG_LEVEL)
+    if config.METRICS_PORT:
+        start_metrics_server(config.METRICS_PORT)
+
+
 def main():
+    start_monitoring()
     if st.session_state.get("page_control", 0) == 1:
         download_pdf_page()
     else:
@@ -0,0 +1,170 @@
+"""Generate articles for many topics on one event loop.
+
+    python batch.py topics.txt --workers 8 --out-dir output
+
+``topics.txt`` holds one topic per line (blank lines and ``#`` comments are
+ignored). Each finished article is written to ``<out-dir>/<slug>.md`` and a
+stats record is appended to ``<out-dir>/stats.jsonl``. All runs share the
+client registry, the caches and the rate-limit budget of this process.
+
+Every topic is checkpointed under its slug, so rerunning the same file
+resumes failed topics from their last completed node.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import sys
+import time
+from pathlib import Path
+
+import conf.config as config
+from clients import registry_scope
+from graph.checkpoint import ainvoke_resumable, delete_run, open_checkpointer
+from graph.storm_graph import critical_path, get_storm_graph
+from metrics import MetricsCallbackHandler, get_metrics, start_metrics_server
+from scheduler.rate_limiter import get_scheduler
+
+logger = logging.getLogger(__name__)
+
+
+def read_topics(path):
+    topics = []
+    seen = set()
+    for line in Path(path).read_text(encoding="utf-8").splitlines():
+        topic = line.strip()
+        if not topic or topic.startswith("#") or topic in seen:
+            continue
+        seen.add(topic)
+        topics.append(topic)
+    return topics
+
+
+def topic_slug(topic):
+    slug = re.sub(r"[^\w]+", "-", topic.lower()).strip("-")[:80]
+    digest = hashlib.sha1(topic.encode("utf-8")).hexdigest()[:8]
+    return f"{slug}-{digest}" if slug else digest
+
+
+async def run_topic(topic, checkpointer, fresh=False):
+    run_id = topic_slug(topic)
+    if fresh:
+        await delete_run(checkpointer, run_id)
+    storm = get_storm_graph(checkpointer)
+    handler = MetricsCallbackHandler()
+    result = await ainvoke_resumable(
+        storm,
+        {"topic": topic},
+        {"callbacks": [handler], "configurable": {"thread_id": run_id}},
+    )
+    node_seconds = {}
+    for name, start, end in handler.spans:
+        node_seconds[name] = node_seconds.get(name, 0.0) + end - start
+    return result, node_seconds, critical_path(handler.spans)
+
+
+async def run_batch(topics, out_dir, workers, overwrite=False):
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    stats_path = out_dir / "stats.jsonl"
+
+    queue = asyncio.Queue()
+    for topic in topics:
+        article_path = out_dir / f"{topic_slug(topic)}.md"
+        if article_path.exists() and not overwrite:
+            logger.info("skip (already written): %s", topic)
+            continue
+        queue.put_nowait((topic, article_path))
+    total = queue.qsize()
+    summary = {"ok": 0, "error": 0}
+
+    async def worker():
+        while True:
+            try:
+                topic, article_path = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            record = {"topic": topic, "article_path": str(article_path)}
+            start = time.perf_counter()
+            try:
+                result, node_seconds, path = await run_topic(
+                    topic, checkpointer, fresh=overwrite
+                )
+            except Exception as e:
+                logger.exception("failed: %s", topic)
+                record.update(status="error", error=f"{type(e).__name__}: {e}")
+                summary["error"] += 1
+            else:
+                article = result["article"]
+                article_path.write_text(article, encoding="utf-8")
+                record.update(
+                    status="ok",
+                    editors=len(result["editors"]),
+                    sections=len(result["sections"]),
+                    references=sum(
+                        len(r.get("references") or {})
+                        for r in result["interview_results"]
+                    ),
+                    article_chars=len(article),
+                    node_seconds=node_seconds,
+                    critical_path=path,
+                )
+                summary["ok"] += 1
+            record["wall_seconds"] = time.perf_counter() - start
+            with stats_path.open("a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            done = summary["ok"] + summary["error"]
+            logger.info(
+                "[%d/%d] %s %s (%.1fs)",
+                done,
+                total,
+                record["status"],
+                topic,
+                record["wall_seconds"],
+            )
+
+    start = time.perf_counter()
+    async with registry_scope(), open_checkpointer() as checkpointer:
+        await asyncio.gather(*(worker() for _ in range(max(1, workers))))
+    summary["wall_seconds"] = time.perf_counter() - start
+    summary["scheduler"] = get_scheduler().stats()
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("topics", help="file with one topic per line")
+    parser.add_argument("--workers", type=int, default=config.BATCH_WORKERS)
+    parser.add_argument("--out-dir", default=config.BATCH_OUTPUT_DIR)
+    parser.add_argument(
+        "--overwrite", action="store_true", help="regenerate existing articles"
+    )
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=config.LOG_LEVEL)
+    if config.METRICS_PORT:
+        start_metrics_server(config.METRICS_PORT)
+    if sys.platform.startswith("win"):
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
+    topics = read_topics(args.topics)
+    summary = asyncio.run(
+        run_batch(topics, args.out_dir, args.workers, overwrite=args.overwrite)
+    )
+    logger.info(
+        "%d ok, %d failed in %.1fs",
+        summary["ok"],
+        summary["error"],
+        summary["wall_seconds"],
+    )
+    for provider, stats in summary["scheduler"].items():
+        logger.info("scheduler %s: %s", provider, stats)
+    logger.debug("metrics: %s", get_metrics().snapshot())
+    return 1 if summary["error"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
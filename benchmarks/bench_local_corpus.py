@@ -0,0 +1,147 @@
+"""Indexing throughput and query latency of the local BM25 corpus index.
+
+    python -m benchmarks.bench_local_corpus --docs 100000 --files 10000
+
+Documents are synthetic (Zipf-distributed vocabulary). ``--docs`` passages
+are indexed through ``add_documents``; ``--files`` files are written to a
+temporary directory to time a full, an unchanged and a 1% changed re-index.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from retriever.local_corpus import LocalCorpusIndex
+
+
+def make_vocabulary(size, rng):
+    letters = np.array(list("abcdefghijklmnopqrstuvwxyz"))
+    return [
+        "".join(rng.choice(letters, size=rng.integers(3, 10))) + str(i)
+        for i in range(size)
+    ]
+
+
+def make_documents(count, words, vocabulary, rng):
+    ranks = np.minimum(rng.zipf(1.1, size=(count, words)), len(vocabulary)) - 1
+    return [" ".join(vocabulary[r] for r in row) for row in ranks]
+
+
+def percentile_ms(samples, q):
+    return float(np.percentile(samples, q) * 1000)
+
+
+def time_queries(index, queries, k):
+    index.search(queries[0], k)
+    samples = []
+    for query in queries:
+        start = time.perf_counter()
+        index.search(query, k)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def bench_passages(path, docs, words, vocabulary, queries, k, rng):
+    row = {"docs": docs}
+    texts = make_documents(docs, words, vocabulary, rng)
+    index = LocalCorpusIndex(path)
+    start = time.perf_counter()
+    index.add_documents((f"doc://{i}", text) for i, text in enumerate(texts))
+    index.commit()
+    elapsed = time.perf_counter() - start
+    row["index_s"] = elapsed
+    row["index_docs_per_s"] = docs / elapsed
+
+    samples = time_queries(index, queries, k)
+    row["query_p50_ms"] = percentile_ms(samples, 50)
+    row["query_p95_ms"] = percentile_ms(samples, 95)
+
+    changed = max(1, docs // 100)
+    start = time.perf_counter()
+    index.add_documents(
+        (f"doc://{i}", text)
+        for i, text in enumerate(make_documents(changed, words, vocabulary, rng))
+    )
+    index.commit()
+    row["update_1pct_s"] = time.perf_counter() - start
+    index.close()
+
+    start = time.perf_counter()
+    index = LocalCorpusIndex(path)
+    row["open_s"] = time.perf_counter() - start
+    row["size_mb"] = os.path.getsize(path) / 1e6
+    index.close()
+    return row
+
+
+def bench_directory(path, directory, files, words, vocabulary, rng):
+    row = {"files": files}
+    texts = make_documents(files, words, vocabulary, rng)
+    for i, text in enumerate(texts):
+        with open(os.path.join(directory, f"{i}.txt"), "w", encoding="utf-8") as f:
+            f.write(text)
+    index = LocalCorpusIndex(path)
+    for label, touched in (("full", 0), ("unchanged", 0), ("1pct_changed", 0.01)):
+        for i in range(int(files * touched)):
+            with open(os.path.join(directory, f"{i}.txt"), "a", encoding="utf-8") as f:
+                f.write(" changed")
+        start = time.perf_counter()
+        index.update_from_directory(directory)
+        row[f"reindex_{label}_s"] = time.perf_counter() - start
+    index.close()
+    return row
+
+
+def print_row(row):
+    print(
+        "  ".join(
+            f"{key}={value:.3f}" if isinstance(value, float) else f"{key}={value}"
+            for key, value in row.items()
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--files", type=int, default=10000)
+    parser.add_argument("--words", type=int, default=150)
+    parser.add_argument("--vocabulary", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vocabulary = make_vocabulary(args.vocabulary, rng)
+    # 1〜6 語のクエリ。頻出語と稀な語が混ざるよう Zipf から引く
+    queries = [
+        " ".join(make_documents(1, int(rng.integers(1, 7)), vocabulary, rng))
+        for _ in range(args.queries)
+    ]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for docs in args.docs:
+            path = os.path.join(tmp, f"passages-{docs}.sqlite")
+            print_row(
+                bench_passages(path, docs, args.words, vocabulary, queries, args.k, rng)
+            )
+        if args.files:
+            directory = os.path.join(tmp, "corpus")
+            os.makedirs(directory)
+            print_row(
+                bench_directory(
+                    os.path.join(tmp, "files.sqlite"),
+                    directory,
+                    args.files,
+                    args.words,
+                    vocabulary,
+                    rng,
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Query latency of NumpyVectorStore vs SKLearnVectorStore.
+
+    python -m benchmarks.bench_vector_store --sizes 1000 10000 100000
+
+Vectors are random; no embedding API is called.
+"""
+
+import argparse
+import time
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from retriever.numpy_vector_store import NumpyVectorStore
+
+
+class LookupEmbeddings(Embeddings):
+    """Returns precomputed vectors for ``doc-<i>`` texts and a fixed query vector."""
+
+    def __init__(self, vectors: np.ndarray, query: np.ndarray):
+        self.vectors = vectors
+        self.query = query
+
+    def embed_documents(self, texts):
+        return [self.vectors[int(t.split("-")[1])].tolist() for t in texts]
+
+    def embed_query(self, text):
+        return self.query.tolist()
+
+
+def time_queries(store, query, k, repeats):
+    # 1 回目はウォームアップ
+    store.similarity_search_by_vector(query, k=k)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        store.similarity_search_by_vector(query, k=k)
+    return (time.perf_counter() - start) / repeats * 1000
+
+
+def bench(size, dim, k, repeats, with_sklearn):
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((size, dim), dtype=np.float32)
+    query = rng.standard_normal(dim, dtype=np.float32)
+    texts = [f"doc-{i}" for i in range(size)]
+    metadatas = [{"source": f"https://example.com/{i}"} for i in range(size)]
+    embeddings = LookupEmbeddings(vectors, query)
+
+    row = {"size": size}
+    start = time.perf_counter()
+    store = NumpyVectorStore(embedding=embeddings)
+    store.add_vectors(vectors, texts, metadatas)
+    row["numpy_build_s"] = time.perf_counter() - start
+    row["numpy_query_ms"] = time_queries(store, query.tolist(), k, repeats)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        store.max_marginal_relevance_search_by_vector(query, k=k, fetch_k=4 * k)
+    row["numpy_mmr_ms"] = (time.perf_counter() - start) / repeats * 1000
+
+    if with_sklearn:
+        from langchain_community.vectorstores import SKLearnVectorStore
+
+        start = time.perf_counter()
+        sk_store = SKLearnVectorStore(embedding=embeddings)
+        sk_store.add_texts(texts, metadatas)
+        row["sklearn_build_s"] = time.perf_counter() - start
+        row["sklearn_query_ms"] = time_queries(sk_store, query.tolist(), k, repeats)
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--no-sklearn", action="store_true")
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        row = bench(size, args.dim, args.k, args.repeats, not args.no_sklearn)
+        print(
+            "  ".join(
+                f"{key}={value:.3f}" if isinstance(value, float) else f"{key}={value}"
+                for key, value in row.items()
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+"""Deterministic offline stand-ins for the LLM, embedding, search and
+Wikipedia clients, with configurable latency and output size."""
+
+import asyncio
+import hashlib
+import json
+import random
+import re
+import time
+import typing
+from dataclasses import dataclass
+from operator import itemgetter
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.output_parsers.openai_tools import PydanticToolsParser
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import RunnableMap, RunnablePassthrough
+
+_URL = re.compile(r"https?://[^\s\"'<>]+")
+_WORDS = (
+    "context retrieval model token window language generation augmented "
+    "document index latency memory evaluation benchmark attention corpus "
+    "answer question citation source research editor outline section"
+).split()
+
+
+@dataclass
+class Latency:
+    """Log-normal latency: ``median_s * exp(sigma * N(0, 1))``."""
+
+    median_s: float = 0.0
+    sigma: float = 0.0
+
+    def sample(self, rng: random.Random) -> float:
+        if self.median_s <= 0:
+            return 0.0
+        return self.median_s * float(np.exp(self.sigma * rng.gauss(0, 1)))
+
+
+def _seed(*parts: str) -> int:
+    return int(hashlib.sha256("\x00".join(parts).encode("utf-8")).hexdigest()[:12], 16)
+
+
+def _text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(_WORDS) for _ in range(words))
+
+
+class FakeChatModel(BaseChatModel):
+    """Chat model that fabricates schema-valid tool calls or plain text.
+
+    Output depends only on the prompt, so runs are reproducible. Fields named
+    like ``*url*`` / ``citations`` reuse URLs found in the prompt, so
+    citations resolve against the fake search results. Plain-text answers
+    are streamed word by word; tool calls are always returned whole.
+    """
+
+    model: str = "fake"
+    latency: Any = Latency()
+    output_words: int = 60
+    list_sizes: Dict[str, int] = {}
+    disable_streaming: Any = "tool_calling"
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model": self.model}
+
+    def bind_tools(self, tools, tool_choice=None, **kwargs):
+        return self.bind(tools=list(tools))
+
+    def with_structured_output(self, schema, include_raw: bool = False, **kwargs):
+        llm = self.bind_tools([schema])
+        parser = PydanticToolsParser(tools=[schema], first_tool_only=True)
+        if not include_raw:
+            return llm | parser
+        return RunnableMap(raw=llm) | RunnablePassthrough.assign(
+            parsed=itemgetter("raw") | parser, parsing_error=lambda _: None
+        )
+
+    def _value(self, rng, name, annotation, urls, depth=0):
+        origin = typing.get_origin(annotation)
+        args = typing.get_args(annotation)
+        if origin is typing.Union:
+            annotation = next(a for a in args if a is not type(None))
+            return self._value(rng, name, annotation, urls, depth)
+        if origin in (list, List):
+            size = self.list_sizes.get(name, 3)
+            return [
+                self._value(rng, name, args[0], urls, depth + 1) for _ in range(size)
+            ]
+        if isinstance(annotation, type) and hasattr(annotation, "__fields__"):
+            return self._fake_object(rng, annotation, urls, depth + 1)
+        if "url" in name or name == "citations":
+            return (
+                rng.choice(urls)
+                if urls
+                else f"https://example.com/{rng.randrange(10**6)}"
+            )
+        if name == "name":
+            return f"Editor_{rng.randrange(10**6)}"
+        if "title" in name:
+            return _text(rng, 4).title()
+        return _text(rng, self.output_words)
+
+    def _fake_object(self, rng, schema, urls, depth=0):
+        return {
+            name: self._value(rng, name, field.annotation, urls, depth)
+            for name, field in schema.__fields__.items()
+        }
+
+    def _respond(self, messages: List[BaseMessage], schemas=None):
+        prompt = "\n".join(str(m.content) for m in messages)
+        rng = random.Random(_seed(self.model, prompt))
+        urls = sorted(set(_URL.findall(prompt)))
+        usage = {
+            "prompt_tokens": len(prompt) // 4,
+            "completion_tokens": self.output_words,
+            "total_tokens": len(prompt) // 4 + self.output_words,
+        }
+        if schemas:
+            schema = schemas[0]
+            args = self._fake_object(rng, schema, urls)
+            call_id = f"call_{rng.randrange(10**9)}"
+            message = AIMessage(
+                content="",
+                additional_kwargs={
+                    "tool_calls": [
+                        {
+                            "id": call_id,
+                            "type": "function",
+                            "function": {
+                                "name": schema.__name__,
+                                "arguments": json.dumps(args),
+                            },
+                        }
+                    ]
+                },
+                tool_calls=[{"name": schema.__name__, "args": args, "id": call_id}],
+            )
+        else:
+            message = AIMessage(content=_text(rng, self.output_words))
+        delay = self.latency.sample(rng)
+        result = ChatResult(
+            generations=[ChatGeneration(message=message)],
+            llm_output={"token_usage": usage, "model_name": self.model},
+        )
+        return delay, result
+
+    def _generate(self, messages, stop=None, run_manager=None, tools=None, **kwargs):
+        delay, result = self._respond(messages, tools)
+        time.sleep(delay)
+        return result
+
+    async def _agenerate(
+        self, messages, stop=None, run_manager=None, tools=None, **kwargs
+    ):
+        delay, result = self._respond(messages, tools)
+        await asyncio.sleep(delay)
+        return result
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        delay, result = self._respond(messages)
+        words = result.generations[0].message.content.split(" ")
+        for i, word in enumerate(words):
+            await asyncio.sleep(delay / len(words))
+            chunk = ChatGenerationChunk(
+                message=AIMessageChunk(content=word if i == 0 else " " + word)
+            )
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+
+class FakeEmbeddings(Embeddings):
+    def __init__(
+        self, model: Optional[str] = None, dim: int = 256, latency: Latency = Latency()
+    ):
+        self.model = model or "fake-embedding"
+        self.dim = dim
+        self.latency = latency
+        self.calls = 0
+
+    def _vector(self, text: str) -> List[float]:
+        rng = np.random.default_rng(_seed(self.model, text))
+        return rng.standard_normal(self.dim).astype(np.float32).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        time.sleep(self.latency.sample(random.Random(len(texts))))
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        await asyncio.sleep(self.latency.sample(random.Random(len(texts))))
+        return [self._vector(t) for t in texts]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+class FakeSearch:
+    """Async search backend returning ``num_results`` snippets per query."""
+
+    def __init__(
+        self, latency: Latency = Latency(), num_results: int = 5, words: int = 80
+    ):
+        self.latency = latency
+        self.num_results = num_results
+        self.words = words
+        self.calls = 0
+
+    async def __call__(self, query: str):
+        self.calls += 1
+        rng = random.Random(_seed("search", query))
+        await asyncio.sleep(self.latency.sample(rng))
+        # 一部の URL はクエリ間で重複させる（実際の検索結果と同様）
+        return [
+            {
+                "content": _text(rng, self.words),
+                "url": f"https://example.com/{rng.randrange(50)}",
+            }
+            for _ in range(self.num_results)
+        ]
+
+
+class FakeWikipedia:
+    def __init__(self, latency: Latency = Latency(), words: int = 60):
+        self.latency = latency
+        self.words = words
+
+    async def aget(self, subject: str):
+        rng = random.Random(_seed("wikipedia", subject))
+        await asyncio.sleep(self.latency.sample(rng))
+        return [
+            Document(
+                page_content=_text(rng, self.words),
+                metadata={
+                    "title": subject,
+                    "categories": [_text(rng, 2)],
+                    "source": "",
+                },
+            )
+        ]
+
+    async def abatch(self, subjects: List[str], return_exceptions: bool = True):
+        return await asyncio.gather(
+            *(self.aget(s) for s in subjects), return_exceptions=return_exceptions
+        )
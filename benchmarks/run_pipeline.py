@@ -0,0 +1,273 @@
+"""End-to-end benchmark of the STORM graphs against offline fakes.
+
+    python -m benchmarks.run_pipeline --editors 2 4 --turns 2 4 --topics 1 4
+
+Every combination of editors x turns x concurrent topics is run once. Results
+(per-node wall time, critical path, peak RSS, throughput) are appended to
+``--results`` and compared with the previous run of the same configuration.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+# キャッシュは実行ごとに一時ディレクトリへ、レート制限は実質無効にする
+_CACHE_DIR = tempfile.mkdtemp(prefix="storm-bench-")
+for _key, _value in {
+    "OPENAI_API_KEY": "benchmark",
+    "STORM_SEARCH_CACHE_PATH": os.path.join(_CACHE_DIR, "search.sqlite"),
+    "STORM_LLM_CACHE_ENABLED": "0",
+    "STORM_EMBEDDING_CACHE_DIR": os.path.join(_CACHE_DIR, "embeddings"),
+    "STORM_WIKIPEDIA_CACHE_PATH": os.path.join(_CACHE_DIR, "wikipedia.sqlite"),
+    "STORM_OPENAI_RPM": "1000000000",
+    "STORM_OPENAI_TPM": "1000000000000",
+    "STORM_EMBEDDINGS_RPM": "1000000000",
+    "STORM_EMBEDDINGS_TPM": "1000000000000",
+    "STORM_DDG_RPM": "1000000000",
+    "STORM_DDG_MAX_IN_FLIGHT": "1000",
+    "STORM_WIKIPEDIA_RPM": "1000000000",
+}.items():
+    os.environ.setdefault(_key, _value)
+
+from langchain_core.messages import AIMessage  # noqa: E402
+
+import graph.interview_graph as interview_graph_module  # noqa: E402
+from benchmarks.fakes import (  # noqa: E402
+    FakeChatModel,
+    FakeEmbeddings,
+    FakeSearch,
+    FakeWikipedia,
+    Latency,
+)
+from clients.registry import override_clients  # noqa: E402
+from graph.interview_graph import get_interview_graph  # noqa: E402
+from graph.storm_graph import (  # noqa: E402
+    critical_path,
+    format_critical_path,
+    get_storm_graph,
+)
+from metrics.callbacks import (  # noqa: E402
+    INTERVIEW_NODES,
+    STORM_NODES,
+    MetricsCallbackHandler,
+)
+from metrics.recorder import get_metrics  # noqa: E402
+from modules.generate_perspectives import Editor  # noqa: E402
+
+
+def timeline_critical_path(spans):
+    """Walk back from the last node to finish, each time taking the node that
+    finished last before the current one started. Used for the interview
+    graph, whose nodes repeat; STORM runs use the graph's dependencies."""
+    if not spans:
+        return []
+    spans = sorted(spans, key=lambda s: s[2])
+    path = [spans[-1]]
+    while True:
+        start = path[-1][1]
+        before = [s for s in spans if s[2] <= start + 1e-6 and s is not path[-1]]
+        if not before:
+            break
+        path.append(before[-1])
+    return [(name, end - start) for name, start, end in reversed(path)]
+
+
+def summarize(spans):
+    totals = defaultdict(float)
+    counts = defaultdict(int)
+    for name, start, end in spans:
+        totals[name] += end - start
+        counts[name] += 1
+    return {name: {"total_s": totals[name], "count": counts[name]} for name in totals}
+
+
+def install_fakes(args):
+    override_clients(
+        chat_model=lambda model, **kwargs: FakeChatModel(
+            model=model,
+            latency=Latency(args.llm_latency, args.latency_sigma),
+            output_words=args.output_words,
+            list_sizes={
+                "editors": args.current_editors,
+                "sections": args.sections,
+                "subsections": 2,
+                "queries": args.queries,
+                "topics": args.related_topics,
+                "cited_urls": 3,
+                "citations": 3,
+            },
+        ),
+        embeddings=lambda model=None: FakeEmbeddings(
+            model=model, latency=Latency(args.embedding_latency, args.latency_sigma)
+        ),
+        search=FakeSearch(
+            latency=Latency(args.search_latency, args.latency_sigma),
+            num_results=args.search_results,
+        ),
+        wikipedia=FakeWikipedia(
+            latency=Latency(args.wikipedia_latency, args.latency_sigma)
+        ),
+    )
+
+
+async def run_storm(num_topics, assembly_mode=None):
+    timer = MetricsCallbackHandler(STORM_NODES | INTERVIEW_NODES)
+
+    async def one(i):
+        storm = get_storm_graph(assembly_mode=assembly_mode)
+        async for _ in storm.astream(
+            {"topic": f"Benchmark topic {i}"}, {"callbacks": [timer]}
+        ):
+            pass
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(num_topics)))
+    return time.perf_counter() - start, timer.spans
+
+
+async def run_interview(num_editors):
+    timer = MetricsCallbackHandler(INTERVIEW_NODES)
+    interview_graph = get_interview_graph()
+    initial_states = [
+        {
+            "editor": Editor(
+                affiliation="Benchmark",
+                name=f"Editor_{i}",
+                role="Researcher",
+                description="Benchmark editor",
+            ),
+            "messages": [
+                AIMessage(
+                    content="So you said you were writing an article on benchmarks?",
+                    name="Subject_Matter_Expert",
+                )
+            ],
+        }
+        for i in range(num_editors)
+    ]
+    start = time.perf_counter()
+    await interview_graph.abatch(initial_states, {"callbacks": [timer]})
+    return time.perf_counter() - start, timer.spans
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            text=True,
+            stderr=subprocess.DEVNULL,
+        ).strip()
+    except Exception:
+        return None
+
+
+def load_previous(path):
+    previous = {}
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                previous[json.dumps(record["config"], sort_keys=True)] = record
+    return previous
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--graph", choices=["storm", "interview"], default="storm")
+    parser.add_argument("--editors", type=int, nargs="+", default=[3])
+    parser.add_argument("--turns", type=int, nargs="+", default=[3])
+    parser.add_argument("--topics", type=int, nargs="+", default=[1])
+    parser.add_argument("--sections", type=int, default=5)
+    parser.add_argument("--assembly", choices=["llm", "local"], default="llm")
+    parser.add_argument("--queries", type=int, default=3)
+    parser.add_argument("--related-topics", type=int, default=5)
+    parser.add_argument("--search-results", type=int, default=5)
+    parser.add_argument("--output-words", type=int, default=60)
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    parser.add_argument("--embedding-latency", type=float, default=0.01)
+    parser.add_argument("--search-latency", type=float, default=0.02)
+    parser.add_argument("--wikipedia-latency", type=float, default=0.02)
+    parser.add_argument("--latency-sigma", type=float, default=0.3)
+    parser.add_argument("--results", default="benchmarks/results.jsonl")
+    parser.add_argument("--regression-threshold", type=float, default=0.10)
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args()
+
+    previous = load_previous(args.results)
+    regressions = []
+    for editors, turns, topics in itertools.product(
+        args.editors, args.turns, args.topics
+    ):
+        args.current_editors = editors
+        install_fakes(args)
+        interview_graph_module.max_num_turns = turns
+        if args.graph == "storm":
+            wall, spans = asyncio.run(run_storm(topics, args.assembly))
+        else:
+            wall, spans = asyncio.run(run_interview(editors))
+        storm_spans = [s for s in spans if s[0] in STORM_NODES]
+        bench_config = {
+            "graph": args.graph,
+            "editors": editors,
+            "turns": turns,
+            "topics": topics if args.graph == "storm" else 1,
+            "sections": args.sections,
+            "queries": args.queries,
+            "llm_latency": args.llm_latency,
+            "search_latency": args.search_latency,
+            "embedding_latency": args.embedding_latency,
+            "assembly": args.assembly,
+        }
+        record = {
+            "timestamp": time.time(),
+            "revision": git_revision(),
+            "config": bench_config,
+            "wall_s": wall,
+            "throughput_topics_per_min": (
+                bench_config["topics"] / wall * 60 if args.graph == "storm" else None
+            ),
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            "nodes": summarize(spans),
+            "critical_path": (
+                critical_path(storm_spans)
+                if storm_spans
+                else timeline_critical_path(spans)
+            ),
+            "metrics": get_metrics().snapshot(),
+        }
+
+        key = json.dumps(bench_config, sort_keys=True)
+        change = None
+        if key in previous:
+            change = wall / previous[key]["wall_s"] - 1
+            if change > args.regression_threshold:
+                regressions.append((bench_config, change))
+        print(
+            f"editors={editors} turns={turns} topics={bench_config['topics']} "
+            f"wall={wall:.2f}s rss={record['peak_rss_mb']:.0f}MB"
+            + (f" change={change:+.1%}" if change is not None else "")
+        )
+        for name, stats in sorted(record["nodes"].items()):
+            print(f"  {name:<20} {stats['total_s']:8.3f}s x{stats['count']}")
+        print("  critical path: " + format_critical_path(record["critical_path"]))
+
+        os.makedirs(os.path.dirname(os.path.abspath(args.results)), exist_ok=True)
+        with open(args.results, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+
+    for bench_config, change in regressions:
+        print(f"REGRESSION {change:+.1%}: {bench_config}")
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,9 @@
+from .search_cache import SearchCache, get_search_cache, normalize_query
+from .sqlite_store import SQLiteKVStore
+from .llm_cache import SQLiteLLMCache, get_llm_cache, resolve_llm_cache
+from .embedding_cache import (
+    CachedEmbeddings,
+    EmbeddingStore,
+    get_embedding_store,
+    with_embedding_cache,
+)
@@ -0,0 +1,238 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+import conf.config as config
+from metrics.recorder import get_metrics
+
+
+def text_digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+@contextmanager
+def _file_lock(path: str):
+    """Exclusive lock shared by every process using ``path``."""
+    with open(path, "a+b") as f:
+        if os.name == "nt":
+            import msvcrt
+
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class EmbeddingStore:
+    """Append-only on-disk embedding store for a single embedding model.
+
+    ``vectors.f32`` holds float32 rows and is read through ``np.memmap``;
+    ``index.jsonl`` maps sha256(text) to its row. Row numbers always come
+    from the size of ``vectors.f32``, so rows left without an index line by a
+    crash are skipped over rather than reused. Writers take a file lock, and
+    entries appended by other processes (e.g. the app and a batch run sharing
+    the cache directory) are picked up on the next miss.
+    """
+
+    def __init__(self, directory: str, model: str):
+        self.directory = os.path.join(directory, re.sub(r"[^\w.-]", "_", model))
+        os.makedirs(self.directory, exist_ok=True)
+        self.model = model
+        self.vectors_path = os.path.join(self.directory, "vectors.f32")
+        self.index_path = os.path.join(self.directory, "index.jsonl")
+        self.meta_path = os.path.join(self.directory, "meta.json")
+        self.lock_path = os.path.join(self.directory, "lock")
+        self._lock = threading.Lock()
+        self._rows: Dict[str, int] = {}
+        self._dim: Optional[int] = None
+        self._num_rows = 0
+        self._index_offset = 0
+        self._memmap: Optional[np.memmap] = None
+        with self._lock, _file_lock(self.lock_path):
+            self._refresh(truncate=True)
+
+    def _refresh(self, truncate: bool = False):
+        """Catch up with rows and index lines written since the last call."""
+        if self._dim is None and os.path.exists(self.meta_path):
+            with open(self.meta_path, encoding="utf-8") as f:
+                self._dim = json.load(f)["dim"]
+        if self._dim is None or not os.path.exists(self.vectors_path):
+            return
+        row_bytes = 4 * self._dim
+        size = os.path.getsize(self.vectors_path)
+        if truncate and size % row_bytes:
+            # 書き込み途中の行があれば切り詰めて行境界を揃える
+            os.truncate(self.vectors_path, size - size % row_bytes)
+        self._num_rows = size // row_bytes
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path, "rb") as f:
+            f.seek(self._index_offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # 書き込み途中の最終行は次回に読む
+                    break
+                self._index_offset += len(line)
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if entry["row"] < self._num_rows:
+                    self._rows[entry["key"]] = entry["row"]
+
+    def __len__(self):
+        return len(self._rows)
+
+    def _vectors(self) -> np.ndarray:
+        if self._memmap is None or self._memmap.shape[0] < self._num_rows:
+            self._memmap = np.memmap(
+                self.vectors_path,
+                dtype=np.float32,
+                mode="r",
+                shape=(self._num_rows, self._dim),
+            )
+        return self._memmap
+
+    def get_many(self, digests: List[str]) -> Dict[str, np.ndarray]:
+        with self._lock:
+            if any(d not in self._rows for d in digests):
+                self._refresh()
+            rows = {d: self._rows[d] for d in digests if d in self._rows}
+            if not rows:
+                return {}
+            vectors = self._vectors()
+            return {d: np.array(vectors[row]) for d, row in rows.items()}
+
+    def put_many(self, digests: List[str], vectors) -> None:
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        with self._lock, _file_lock(self.lock_path):
+            self._refresh(truncate=True)
+            if self._dim is None:
+                self._dim = vectors.shape[1]
+                with open(self.meta_path, "w", encoding="utf-8") as f:
+                    json.dump({"model": self.model, "dim": self._dim}, f)
+            new = {d: v for d, v in zip(digests, vectors) if d not in self._rows}
+            if not new:
+                return
+            with open(self.vectors_path, "ab") as f:
+                f.write(np.stack(list(new.values())).tobytes())
+            lines = []
+            for d in new:
+                lines.append(json.dumps({"key": d, "row": self._num_rows}) + "\n")
+                self._rows[d] = self._num_rows
+                self._num_rows += 1
+            with open(self.index_path, "a", encoding="utf-8") as f:
+                f.write("".join(lines))
+            self._index_offset = os.path.getsize(self.index_path)
+
+
+class CachedEmbeddings(Embeddings):
+    """Serves embeddings from an EmbeddingStore and sends only misses, batched
+    and de-duplicated, to the wrapped embedding model."""
+
+    def __init__(
+        self, underlying: Embeddings, store: EmbeddingStore, batch_size: int = 1000
+    ):
+        self.underlying = underlying
+        self.store = store
+        self.batch_size = batch_size
+        self.hits = 0
+        self.misses = 0
+
+    def _split(self, texts: List[str]):
+        digests = [text_digest(t) for t in texts]
+        found = self.store.get_many(digests)
+        missing = {}
+        for digest, text in zip(digests, texts):
+            if digest not in found:
+                missing.setdefault(digest, text)
+        hits = sum(d in found for d in digests)
+        self.hits += hits
+        self.misses += len(missing)
+        get_metrics().record(
+            "embedding_cache",
+            self.store.model,
+            cache_hit=not missing,
+            hits=hits,
+            misses=len(missing),
+        )
+        return digests, found, missing
+
+    def _batches(self, missing: Dict[str, str]):
+        items = list(missing.items())
+        for i in range(0, len(items), self.batch_size):
+            yield items[i : i + self.batch_size]
+
+    @staticmethod
+    def _merge(digests, found):
+        return [found[d].tolist() for d in digests]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        digests, found, missing = self._split(texts)
+        for batch in self._batches(missing):
+            vectors = self.underlying.embed_documents([t for _, t in batch])
+            self.store.put_many([d for d, _ in batch], vectors)
+            found.update(
+                zip((d for d, _ in batch), np.asarray(vectors, dtype=np.float32))
+            )
+        return self._merge(digests, found)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        digests, found, missing = self._split(texts)
+        batches = list(self._batches(missing))
+        results = await asyncio.gather(
+            *(self.underlying.aembed_documents([t for _, t in b]) for b in batches)
+        )
+        for batch, vectors in zip(batches, results):
+            self.store.put_many([d for d, _ in batch], vectors)
+            found.update(
+                zip((d for d, _ in batch), np.asarray(vectors, dtype=np.float32))
+            )
+        return self._merge(digests, found)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self.store),
+        }
+
+
+@lru_cache(maxsize=None)
+def get_embedding_store(model: str) -> EmbeddingStore:
+    return EmbeddingStore(config.EMBEDDING_CACHE_DIR, model)
+
+
+def with_embedding_cache(embeddings: Embeddings) -> Embeddings:
+    if not config.EMBEDDING_CACHE_ENABLED:
+        return embeddings
+    model = getattr(embeddings, "model", None) or type(embeddings).__name__
+    return CachedEmbeddings(embeddings, get_embedding_store(model))
@@ -0,0 +1,77 @@
+import hashlib
+import warnings
+from functools import lru_cache
+from typing import Any, Optional
+
+from langchain_core._api import LangChainBetaWarning
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.load import dumps, loads
+
+import conf.config as config
+from .sqlite_store import SQLiteKVStore
+
+
+class SQLiteLLMCache(BaseCache):
+    """Persistent LLM response cache.
+
+    LangChain passes the rendered messages as ``prompt`` and the model
+    parameters (model name, temperature, bound tools / structured-output
+    schema) as ``llm_string``, so hashing both addresses the exact request.
+    Generations served from the cache carry ``cache_hit`` in their
+    ``generation_info``.
+    """
+
+    def __init__(self, path, ttl_seconds=None, max_entries=None):
+        self.store = SQLiteKVStore(
+            path,
+            table="llm_responses",
+            ttl_seconds=ttl_seconds,
+            max_entries=max_entries,
+        )
+
+    @staticmethod
+    def _key(prompt: str, llm_string: str) -> str:
+        return hashlib.sha256(f"{llm_string}\x00{prompt}".encode("utf-8")).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        value = self.store.get(self._key(prompt, llm_string))
+        if value is None:
+            return None
+        with warnings.catch_warnings():
+            # loads は beta 扱いで呼ぶたびに警告が出る
+            warnings.simplefilter("ignore", LangChainBetaWarning)
+            generations = [loads(generation) for generation in value]
+        for generation in generations:
+            generation.generation_info = {
+                **(generation.generation_info or {}),
+                "cache_hit": True,
+            }
+        return generations
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        self.store.set(
+            self._key(prompt, llm_string),
+            [dumps(generation) for generation in return_val],
+        )
+
+    def clear(self, **kwargs: Any) -> None:
+        self.store.clear()
+
+    def stats(self):
+        return self.store.stats()
+
+
+@lru_cache(maxsize=None)
+def get_llm_cache():
+    return SQLiteLLMCache(
+        config.LLM_CACHE_PATH,
+        ttl_seconds=config.LLM_CACHE_TTL_SECONDS,
+        max_entries=config.LLM_CACHE_MAX_ENTRIES,
+    )
+
+
+def resolve_llm_cache(enabled: bool = True):
+    # ChatOpenAI(cache=False) は LangChain のグローバルキャッシュも無効にする
+    if enabled and config.LLM_CACHE_ENABLED:
+        return get_llm_cache()
+    return False
@@ -0,0 +1,39 @@
+import unicodedata
+from functools import lru_cache
+
+import conf.config as config
+from .sqlite_store import SQLiteKVStore
+
+
+def normalize_query(query: str) -> str:
+    # 大文字小文字・全角半角・空白の違いは同じクエリとして扱う
+    # （句読点は "C++" と "C" のように検索結果が変わるので残す）
+    return " ".join(unicodedata.normalize("NFKC", query).casefold().split())
+
+
+class SearchCache:
+    def __init__(self, path, ttl_seconds=None, max_entries=None):
+        self.store = SQLiteKVStore(
+            path,
+            table="search_results",
+            ttl_seconds=ttl_seconds,
+            max_entries=max_entries,
+        )
+
+    def get(self, query: str):
+        return self.store.get(normalize_query(query))
+
+    def set(self, query: str, results: list):
+        self.store.set(normalize_query(query), results)
+
+    def stats(self):
+        return self.store.stats()
+
+
+@lru_cache(maxsize=None)
+def get_search_cache():
+    return SearchCache(
+        config.SEARCH_CACHE_PATH,
+        ttl_seconds=config.SEARCH_CACHE_TTL_SECONDS,
+        max_entries=config.SEARCH_CACHE_MAX_ENTRIES,
+    )
@@ -0,0 +1,11 @@
+from .registry import (
+    ClientRegistry,
+    cached_chain,
+    get_chat_model,
+    get_embeddings,
+    get_override,
+    get_registry,
+    get_search_backend,
+    override_clients,
+    registry_scope,
+)
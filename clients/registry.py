@@ -0,0 +1,168 @@
+import asyncio
+import contextlib
+import functools
+import weakref
+from typing import Optional
+
+import httpx
+from langchain_openai import OpenAIEmbeddings
+
+import conf.config as config
+from cache.embedding_cache import with_embedding_cache
+from cache.llm_cache import resolve_llm_cache
+from scheduler.chat_model import ScheduledChatOpenAI, ScheduledEmbeddings
+from .search import duckduckgo_search, local_corpus_search, with_hedging
+
+# Client factories replaced via override_clients (e.g. fakes for benchmarks)
+_overrides = {}
+
+
+def _http_limits():
+    return httpx.Limits(
+        max_connections=config.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=config.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=config.HTTP_KEEPALIVE_EXPIRY_SECONDS,
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_http_client() -> httpx.Client:
+    return httpx.Client(limits=_http_limits(), timeout=config.HTTP_TIMEOUT_SECONDS)
+
+
+class ClientRegistry:
+    """Builds each model client and chain once and shares one keep-alive
+    connection pool between them.
+
+    Async connection pools are tied to an event loop, so there is one registry
+    per running loop (see ``get_registry``).
+    """
+
+    def __init__(self):
+        self._async_http: Optional[httpx.AsyncClient] = None
+        self._chat_models = {}
+        self._embeddings = {}
+        self._chains = {}
+
+    @property
+    def http_async_client(self) -> httpx.AsyncClient:
+        if self._async_http is None:
+            self._async_http = httpx.AsyncClient(
+                limits=_http_limits(), timeout=config.HTTP_TIMEOUT_SECONDS
+            )
+        return self._async_http
+
+    def chat_model(self, model: str, cache: bool = True, **kwargs):
+        key = (model, cache, tuple(sorted(kwargs.items())))
+        if key not in self._chat_models and "chat_model" in _overrides:
+            self._chat_models[key] = _overrides["chat_model"](model=model, **kwargs)
+        if key not in self._chat_models:
+            settings = {**config.MODEL_SETTINGS.get(model, {}), **kwargs}
+            self._chat_models[key] = ScheduledChatOpenAI(
+                model=model,
+                cache=resolve_llm_cache(cache),
+                http_client=get_http_client(),
+                http_async_client=self.http_async_client,
+                **settings,
+            )
+        return self._chat_models[key]
+
+    def embeddings(self, model: Optional[str] = None):
+        if model not in self._embeddings:
+            if "embeddings" in _overrides:
+                client = _overrides["embeddings"](model=model)
+            else:
+                settings = {**config.MODEL_SETTINGS.get(model or "", {})}
+                if model:
+                    settings["model"] = model
+                client = OpenAIEmbeddings(
+                    http_client=get_http_client(),
+                    http_async_client=self.http_async_client,
+                    **settings,
+                )
+            self._embeddings[model] = with_embedding_cache(ScheduledEmbeddings(client))
+        return self._embeddings[model]
+
+    def chain(self, factory, args, kwargs):
+        key = (factory, args, tuple(sorted(kwargs.items())))
+        if key not in self._chains:
+            self._chains[key] = factory(*args, **kwargs)
+        return self._chains[key]
+
+    async def aclose(self):
+        if self._async_http is not None:
+            await self._async_http.aclose()
+            self._async_http = None
+
+
+_default_registry = ClientRegistry()
+_loop_registries = weakref.WeakKeyDictionary()
+
+
+def get_registry() -> ClientRegistry:
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return _default_registry
+    if loop not in _loop_registries:
+        _loop_registries[loop] = ClientRegistry()
+    return _loop_registries[loop]
+
+
+@contextlib.asynccontextmanager
+async def registry_scope():
+    """Closes the running loop's registry and its connection pool on exit.
+
+    Wrap each run in it; the next call on the same loop builds a new registry.
+    """
+    registry = get_registry()
+    try:
+        yield registry
+    finally:
+        await registry.aclose()
+        _loop_registries.pop(asyncio.get_running_loop(), None)
+
+
+def get_chat_model(model: str, cache: bool = True, **kwargs):
+    return get_registry().chat_model(model, cache=cache, **kwargs)
+
+
+def get_embeddings(model: Optional[str] = None):
+    return get_registry().embeddings(model)
+
+
+def get_search_backend():
+    """Search function with per-request timeout and optional hedging, or the
+    local corpus index when ``SEARCH_BACKEND`` is ``"local"``."""
+    if "search" in _overrides:
+        return with_hedging(_overrides["search"])
+    if config.SEARCH_BACKEND == "local":
+        return local_corpus_search()
+    return with_hedging(duckduckgo_search)
+
+
+def get_override(name: str):
+    return _overrides.get(name)
+
+
+def override_clients(**factories):
+    """Swap client construction, e.g. ``override_clients(chat_model=FakeChatModel)``.
+
+    Supported keys: ``chat_model(model=..., **kwargs)``, ``embeddings(model=...)``,
+    ``search`` (async ``query -> [{"content", "url"}]``) and ``wikipedia``
+    (an object with ``abatch``). Already built clients and chains are dropped.
+    """
+    global _default_registry
+    _overrides.update(factories)
+    _default_registry = ClientRegistry()
+    _loop_registries.clear()
+
+
+def cached_chain(factory):
+    """Memoize a chain factory per registry (i.e. per event loop)."""
+
+    @functools.wraps(factory)
+    def wrapper(*args, **kwargs):
+        return get_registry().chain(factory, args, kwargs)
+
+    return wrapper
@@ -0,0 +1,217 @@
+import asyncio
+import functools
+import logging
+import math
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_community.utilities.duckduckgo_search import DuckDuckGoSearchAPIWrapper
+
+import conf.config as config
+from scheduler.rate_limiter import get_scheduler
+
+logger = logging.getLogger(__name__)
+
+
+@functools.lru_cache(maxsize=None)
+def _search_executor() -> ThreadPoolExecutor:
+    # duckduckgo_search は同期 API なので、イベントループを塞がないようスレッドで実行する
+    return ThreadPoolExecutor(
+        max_workers=config.SEARCH_THREADS, thread_name_prefix="search"
+    )
+
+
+def _ddgs_text(query: str):
+    return DuckDuckGoSearchAPIWrapper()._ddgs_text(query)
+
+
+# 枠を返すタスク（完了前に GC されないよう参照を持っておく）
+_pending_releases = set()
+
+
+class DuckDuckGoSearch:
+    """DuckDuckGo text search, rate limited by the ``duckduckgo`` provider.
+
+    Taking the slot (``acquire``) and sending the request (``start``) are
+    separate steps so that ``HedgedSearch`` can leave the queue wait out of
+    its timeout and latency samples.
+    """
+
+    provider_name = "duckduckgo"
+
+    def provider(self):
+        return get_scheduler().provider(self.provider_name)
+
+    async def acquire(self):
+        await self.provider().acquire()
+
+    def start(self, query: str) -> asyncio.Future:
+        """Send the request on a slot taken with ``acquire``.
+
+        The slot is returned when the thread finishes. Cancelling the returned
+        future stops the wait, not the request.
+        """
+        provider = self.provider()
+        loop = asyncio.get_running_loop()
+
+        def release(done):
+            if done is not None and not done.cancelled():
+                # 呼び出し側がキャンセル済みでも例外は取り出しておく
+                done.exception()
+            task = loop.create_task(provider.release())
+            _pending_releases.add(task)
+            task.add_done_callback(_pending_releases.discard)
+
+        try:
+            future = loop.run_in_executor(_search_executor(), self._search, query)
+        except BaseException:
+            release(None)
+            raise
+        # タイムアウトやヘッジの取り消しで待つのをやめても、スレッドの HTTP リクエストが
+        # 終わるまでは枠を返さない（同時実行数の上限を守る）
+        future.add_done_callback(release)
+        return asyncio.shield(future)
+
+    @staticmethod
+    def _search(query: str):
+        return [{"content": r["body"], "url": r["href"]} for r in _ddgs_text(query)]
+
+    async def __call__(self, query: str):
+        await self.acquire()
+        return await self.start(query)
+
+
+duckduckgo_search = DuckDuckGoSearch()
+
+
+class HedgedSearch:
+    """Adds a per-request timeout and hedged requests to a search backend.
+
+    Once ``min_samples`` latencies are known, a request still running after
+    the ``hedge_percentile`` latency gets a backup request, and whichever
+    finishes first successfully wins.
+
+    Backends with ``acquire``/``start`` (see ``DuckDuckGoSearch``) get their
+    rate-limit slot first; only the request itself is timed.
+    """
+
+    def __init__(
+        self,
+        backend,
+        timeout: float = None,
+        hedge_percentile: float = None,
+        min_samples: int = 20,
+        window: int = 200,
+    ):
+        self.backend = backend
+        self.timeout = config.SEARCH_TIMEOUT_SECONDS if timeout is None else timeout
+        self.hedge_percentile = (
+            config.SEARCH_HEDGE_PERCENTILE
+            if hedge_percentile is None
+            else hedge_percentile
+        )
+        self.min_samples = min_samples
+        self._latencies = deque(maxlen=window)
+        self.requests = 0
+        self.hedged = 0
+        self.timeouts = 0
+
+    def hedge_delay(self):
+        if not self.hedge_percentile or len(self._latencies) < self.min_samples:
+            return None
+        ordered = sorted(self._latencies)
+        index = min(
+            len(ordered) - 1, math.ceil(self.hedge_percentile * len(ordered)) - 1
+        )
+        return ordered[max(0, index)]
+
+    async def _start(self, query: str):
+        if not hasattr(self.backend, "start"):
+            return asyncio.ensure_future(self.backend(query))
+        # 枠が空くまでの待ち時間はタイムアウトにもレイテンシの記録にも含めない
+        await self.backend.acquire()
+        return self.backend.start(query)
+
+    async def _finish(self, request):
+        start = time.perf_counter()
+        try:
+            results = await asyncio.wait_for(request, self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+        self._latencies.append(time.perf_counter() - start)
+        return results
+
+    async def _attempt(self, query: str):
+        return await self._finish(await self._start(query))
+
+    async def __call__(self, query: str):
+        self.requests += 1
+        request = await self._start(query)
+        delay = self.hedge_delay()
+        if delay is None:
+            return await self._finish(request)
+
+        pending = {asyncio.ensure_future(self._finish(request))}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=delay)
+            if not done:
+                self.hedged += 1
+                logger.debug("hedging search after %.2fs: %s", delay, query)
+                pending.add(asyncio.ensure_future(self._attempt(query)))
+            error = None
+            while done or pending:
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = error or task.exception()
+                if not pending:
+                    break
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "hedged": self.hedged,
+            "timeouts": self.timeouts,
+            "hedge_delay_s": self.hedge_delay(),
+        }
+
+
+@functools.lru_cache(maxsize=None)
+def with_hedging(backend) -> HedgedSearch:
+    return HedgedSearch(backend)
+
+
+class LocalCorpusSearch:
+    """Search backend over the local BM25 index (``retriever.local_corpus``).
+
+    Results are not put in the search cache since the index can change
+    between runs, and a query takes milliseconds anyway.
+    """
+
+    cacheable = False
+
+    def __init__(self, num_results: int = None):
+        self.num_results = num_results or config.LOCAL_CORPUS_RESULTS
+        self._index = None
+
+    async def __call__(self, query: str):
+        if self._index is None:
+            from retriever.local_corpus import get_local_corpus
+
+            # 初回は索引の読み込みと差分更新があるのでスレッドで行う
+            self._index = await asyncio.to_thread(get_local_corpus)
+        return self._index.search(query, self.num_results)
+
+
+@functools.lru_cache(maxsize=None)
+def local_corpus_search() -> LocalCorpusSearch:
+    return LocalCorpusSearch()
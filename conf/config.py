@@ -1,3 +1,4 @@
+import json
 import os
 
 from dotenv import load_dotenv
@@ -9,4 +10,149 @@ load_dotenv()
 # os.environ["LANGCHAIN_TRACING_V2"] = os.getenv("LANGCHAIN_TRACING_V2")
 # os.environ["LANGCHAIN_PROJECT"] = os.getenv("LANGCHAIN_PROJECT")
 # os.environ["LANGCHAIN_API_KEY"] = os.getenv("LANGCHAIN_API_KEY")
-os.environ["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY")
+if os.getenv("OPENAI_API_KEY"):
+    os.environ["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY")
+
+# 検索結果キャッシュ
+SEARCH_CACHE_PATH = os.getenv("STORM_SEARCH_CACHE_PATH", ".cache/search_cache.sqlite")
+SEARCH_CACHE_TTL_SECONDS = float(
+    os.getenv("STORM_SEARCH_CACHE_TTL_SECONDS", 7 * 24 * 60 * 60)
+)
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("STORM_SEARCH_CACHE_MAX_ENTRIES", 50000))
+
+# LLM レスポンスキャッシュ
+LLM_CACHE_ENABLED = os.getenv("STORM_LLM_CACHE_ENABLED", "1") == "1"
+LLM_CACHE_PATH = os.getenv("STORM_LLM_CACHE_PATH", ".cache/llm_cache.sqlite")
+LLM_CACHE_TTL_SECONDS = float(
+    os.getenv("STORM_LLM_CACHE_TTL_SECONDS", 30 * 24 * 60 * 60)
+)
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("STORM_LLM_CACHE_MAX_ENTRIES", 20000))
+
+# 埋め込みキャッシュ
+EMBEDDING_CACHE_ENABLED = os.getenv("STORM_EMBEDDING_CACHE_ENABLED", "1") == "1"
+EMBEDDING_CACHE_DIR = os.getenv("STORM_EMBEDDING_CACHE_DIR", ".cache/embeddings")
+
+# 外部呼び出しのレート制限（プロバイダーごと）
+RATE_LIMITS = {
+    "openai": {
+        "requests_per_minute": float(os.getenv("STORM_OPENAI_RPM", 500)),
+        "tokens_per_minute": float(os.getenv("STORM_OPENAI_TPM", 300000)),
+        "max_in_flight": int(os.getenv("STORM_OPENAI_MAX_IN_FLIGHT", 16)),
+    },
+    "openai_embeddings": {
+        "requests_per_minute": float(os.getenv("STORM_EMBEDDINGS_RPM", 500)),
+        "tokens_per_minute": float(os.getenv("STORM_EMBEDDINGS_TPM", 1000000)),
+        "max_in_flight": int(os.getenv("STORM_EMBEDDINGS_MAX_IN_FLIGHT", 8)),
+    },
+    "duckduckgo": {
+        "requests_per_minute": float(os.getenv("STORM_DDG_RPM", 30)),
+        "max_in_flight": int(os.getenv("STORM_DDG_MAX_IN_FLIGHT", 4)),
+    },
+    "wikipedia": {
+        "requests_per_minute": float(os.getenv("STORM_WIKIPEDIA_RPM", 200)),
+        "max_in_flight": int(os.getenv("STORM_WIKIPEDIA_MAX_IN_FLIGHT", 8)),
+    },
+}
+
+# HTTP 接続プール（全モデル・全インタビューで共有）
+HTTP_MAX_CONNECTIONS = int(os.getenv("STORM_HTTP_MAX_CONNECTIONS", 64))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(
+    os.getenv("STORM_HTTP_MAX_KEEPALIVE_CONNECTIONS", 32)
+)
+HTTP_KEEPALIVE_EXPIRY_SECONDS = float(
+    os.getenv("STORM_HTTP_KEEPALIVE_EXPIRY_SECONDS", 60)
+)
+HTTP_TIMEOUT_SECONDS = float(os.getenv("STORM_HTTP_TIMEOUT_SECONDS", 120))
+
+# モデルごとの追加設定（例: {"gpt-4o-2024-05-13": {"max_retries": 4}}）
+MODEL_SETTINGS = json.loads(os.getenv("STORM_MODEL_SETTINGS", "{}"))
+
+# Wikipedia 参照（オフライン時は JSON Lines のダンプを使う）
+WIKIPEDIA_LANG = os.getenv("STORM_WIKIPEDIA_LANG", "en")
+WIKIPEDIA_USER_AGENT = os.getenv(
+    "STORM_WIKIPEDIA_USER_AGENT", "STORM/0.1 (https://github.com/kenthongo/STORM)"
+)
+WIKIPEDIA_CACHE_PATH = os.getenv(
+    "STORM_WIKIPEDIA_CACHE_PATH", ".cache/wikipedia.sqlite"
+)
+WIKIPEDIA_CACHE_TTL_SECONDS = float(
+    os.getenv("STORM_WIKIPEDIA_CACHE_TTL_SECONDS", 30 * 24 * 60 * 60)
+)
+WIKIPEDIA_CACHE_MAX_ENTRIES = int(os.getenv("STORM_WIKIPEDIA_CACHE_MAX_ENTRIES", 20000))
+WIKIPEDIA_OFFLINE_DUMP = os.getenv("STORM_WIKIPEDIA_OFFLINE_DUMP", "")
+
+# メトリクスとログ
+LOG_LEVEL = os.getenv("STORM_LOG_LEVEL", "INFO")
+METRICS_JSONL_PATH = os.getenv("STORM_METRICS_JSONL_PATH", "")
+METRICS_PORT = int(os.getenv("STORM_METRICS_PORT", 0))
+
+# バッチ実行（batch.py）
+BATCH_WORKERS = int(os.getenv("STORM_BATCH_WORKERS", 4))
+BATCH_OUTPUT_DIR = os.getenv("STORM_BATCH_OUTPUT_DIR", "output")
+
+# ノード単位のチェックポイント（run id ごとに再開できる）
+CHECKPOINT_PATH = os.getenv("STORM_CHECKPOINT_PATH", ".cache/checkpoints.sqlite")
+
+# 最終記事の組み立て方（"llm": 全体を LLM で書き直す / "local": セクションを連結して脚注を振り直す）
+ARTICLE_ASSEMBLY_MODE = os.getenv("STORM_ARTICLE_ASSEMBLY_MODE", "llm")
+# local モードで導入段落だけ LLM に書かせるか
+ARTICLE_LEAD_PARAGRAPH = os.getenv("STORM_ARTICLE_LEAD_PARAGRAPH", "1") == "1"
+
+# 参照文書の重複除去（MinHash で推定した Jaccard 類似度がこれ以上なら同一とみなす）
+REFERENCE_DEDUP_THRESHOLD = float(os.getenv("STORM_REFERENCE_DEDUP_THRESHOLD", 0.8))
+
+# インタビューの打ち切り（新しい情報が閾値を下回ったら max_num_turns 前でも終える）
+INTERVIEW_ADAPTIVE_STOP = os.getenv("STORM_INTERVIEW_ADAPTIVE_STOP", "1") == "1"
+INTERVIEW_MIN_TURNS = int(os.getenv("STORM_INTERVIEW_MIN_TURNS", 2))
+# 新しさ = 1 - 既出の回答との最大コサイン類似度。text-embedding-3-small では同じ話題の
+# 別の内容でも類似度は 0.6〜0.8 程度、言い換えや繰り返しで 0.85 を超える
+INTERVIEW_MIN_GAIN = float(os.getenv("STORM_INTERVIEW_MIN_GAIN", 0.15))
+INTERVIEW_GAIN_EMBEDDING_MODEL = os.getenv(
+    "STORM_INTERVIEW_GAIN_EMBEDDING_MODEL", "text-embedding-3-small"
+)
+
+# インタビュー履歴の要約（未要約部分がこのトークン数を超えたら古いターンを要約する。0 で無効）
+INTERVIEW_COMPACT_TOKENS = int(os.getenv("STORM_INTERVIEW_COMPACT_TOKENS", 0))
+INTERVIEW_COMPACT_KEEP_TURNS = int(os.getenv("STORM_INTERVIEW_COMPACT_KEEP_TURNS", 2))
+
+# PDF 出力の本文フォント（`python -m export.fonts` で取得する。空ならインストール済みのフォントのみ）
+PDF_FONT_PATH = os.getenv("STORM_PDF_FONT_PATH", "fonts/NotoSansJP.ttf")
+PDF_WORKERS = int(os.getenv("STORM_PDF_WORKERS", 2))
+
+# 参照文書は文字数 SIZE のパッセージに分割して埋め込む（0 で分割しない）
+REFERENCE_CHUNK_SIZE = int(os.getenv("STORM_REFERENCE_CHUNK_SIZE", 1500))
+REFERENCE_CHUNK_OVERLAP = int(os.getenv("STORM_REFERENCE_CHUNK_OVERLAP", 200))
+
+# インタビューの会話の合計がこのトークン数を超えたら、各インタビューを要約してから
+# アウトラインを改訂する（map-reduce）。0 なら常に会話全体を1回で渡す
+OUTLINE_MAP_REDUCE_TOKENS = int(os.getenv("STORM_OUTLINE_MAP_REDUCE_TOKENS", 24000))
+
+# セクション執筆用の検索（全セクションをまとめて1回で検索する）。K はパッセージ数
+SECTION_RETRIEVAL_K = int(os.getenv("STORM_SECTION_RETRIEVAL_K", 8))
+# サブセクション1つあたりに追加で取る件数（上限は K の2倍）
+SECTION_RETRIEVAL_K_PER_SUBSECTION = int(
+    os.getenv("STORM_SECTION_RETRIEVAL_K_PER_SUBSECTION", 1)
+)
+# 設定すると MMR で多様性を持たせる（0〜1、1 で類似度のみ）
+SECTION_RETRIEVAL_MMR_LAMBDA = (
+    float(os.environ["STORM_SECTION_RETRIEVAL_MMR_LAMBDA"])
+    if os.getenv("STORM_SECTION_RETRIEVAL_MMR_LAMBDA")
+    else None
+)
+# セクションのプロンプトに入れる参照文書のトークン上限（0 で無制限）
+SECTION_CONTEXT_MAX_TOKENS = int(os.getenv("STORM_SECTION_CONTEXT_MAX_TOKENS", 6000))
+
+# 検索（同期クライアントを実行するスレッド数、1リクエストのタイムアウト）
+SEARCH_THREADS = int(os.getenv("STORM_SEARCH_THREADS", 8))
+SEARCH_TIMEOUT_SECONDS = float(os.getenv("STORM_SEARCH_TIMEOUT_SECONDS", 20))
+# 設定すると、この分位点のレイテンシを超えた検索に予備のリクエストを出す（例: 0.95）
+SEARCH_HEDGE_PERCENTILE = float(os.getenv("STORM_SEARCH_HEDGE_PERCENTILE", 0))
+# "duckduckgo" または "local"（ローカルの文書を BM25 で検索し、Web 検索は使わない）
+SEARCH_BACKEND = os.getenv("STORM_SEARCH_BACKEND", "duckduckgo")
+# 検索対象のディレクトリ（初回検索時に差分だけ索引を更新する）
+LOCAL_CORPUS_DIR = os.getenv("STORM_LOCAL_CORPUS_DIR", "")
+LOCAL_CORPUS_INDEX_PATH = os.getenv(
+    "STORM_LOCAL_CORPUS_INDEX_PATH", ".cache/local_corpus.sqlite"
+)
+LOCAL_CORPUS_PASSAGE_WORDS = int(os.getenv("STORM_LOCAL_CORPUS_PASSAGE_WORDS", 200))
+LOCAL_CORPUS_RESULTS = int(os.getenv("STORM_LOCAL_CORPUS_RESULTS", 5))
@@ -0,0 +1 @@
+from .pdf import markdown_to_pdf
@@ -0,0 +1,51 @@
+"""Download the PDF body font (Noto Sans JP, SIL Open Font License).
+
+    python -m export.fonts
+
+The font and its license are saved next to ``STORM_PDF_FONT_PATH``.
+"""
+
+import argparse
+import os
+
+import httpx
+
+import conf.config as config
+
+FONT_URL = (
+    "https://github.com/google/fonts/raw/main/ofl/notosansjp/NotoSansJP%5Bwght%5D.ttf"
+)
+LICENSE_URL = "https://github.com/google/fonts/raw/main/ofl/notosansjp/OFL.txt"
+
+
+def _download(url: str, path: str):
+    with httpx.stream("GET", url, follow_redirects=True, timeout=60) as response:
+        response.raise_for_status()
+        # 途中で失敗しても壊れたファイルを残さない
+        with open(path + ".part", "wb") as f:
+            for chunk in response.iter_bytes():
+                f.write(chunk)
+    os.replace(path + ".part", path)
+
+
+def fetch_font(path: str = None, force: bool = False) -> str:
+    path = path or config.PDF_FONT_PATH
+    if os.path.exists(path) and not force:
+        return path
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    _download(FONT_URL, path)
+    _download(LICENSE_URL, os.path.join(directory, "OFL.txt"))
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--path", default=config.PDF_FONT_PATH)
+    parser.add_argument("--force", action="store_true", help="download again")
+    args = parser.parse_args(argv)
+    print(fetch_font(args.path, args.force))
+
+
+if __name__ == "__main__":
+    main()
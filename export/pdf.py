@@ -0,0 +1,78 @@
+"""Markdown -> PDF rendering.
+
+Kept free of Streamlit imports so it can run in a worker process.
+"""
+
+import os
+from pathlib import Path
+
+from markdown2 import markdown
+from weasyprint import CSS, HTML
+from weasyprint.fonts import FontConfiguration
+
+# フォントファイルに無い文字はインストール済みのフォントを名前で探す（ネットワークには取りに行かない）
+LOCAL_FONT_NAMES = ("Noto Sans JP", "Noto Sans CJK JP", "NotoSansJP-Regular")
+
+PDF_CSS = """
+@font-face {{
+    font-family: 'Article Sans';
+    src: {sources};
+}}
+/* 全体のフォント設定（日本語対応） */
+body {{
+    font-family: 'Article Sans', 'Noto Sans CJK JP', sans-serif;
+}}
+
+/* コードブロックのスタイル設定 */
+pre, code {{
+    font-family: 'Courier New', Courier, monospace;
+    background-color: #f5f5f5;
+    padding: 10px;
+    border-radius: 5px;
+    overflow: auto;
+}}
+
+/* PDF化を考慮したページの設定 */
+@media print {{
+    body {{
+        font-size: 12pt;
+    }}
+
+    pre, code {{
+        font-size: 10pt;
+        white-space: pre-wrap;
+        word-wrap: break-word;
+    }}
+
+    /* ページの余白設定 */
+    @page {{
+        margin: 1in;
+    }}
+}}
+"""
+
+
+def _font_sources(font_path: str = None) -> str:
+    sources = [f"local('{name}')" for name in LOCAL_FONT_NAMES]
+    if font_path:
+        if not os.path.exists(font_path):
+            raise FileNotFoundError(
+                f"PDF font not found: {font_path}. Download it with"
+                " `python -m export.fonts`, or set STORM_PDF_FONT_PATH to a"
+                " TTF/OTF file (empty to use installed fonts only)."
+            )
+        sources.insert(0, f"url('{Path(font_path).resolve().as_uri()}')")
+    return ", ".join(sources)
+
+
+def markdown_to_pdf(markdown_text: str, font_path: str = None) -> bytes:
+    """Render markdown to PDF bytes in memory, using ``font_path`` (a TTF/OTF
+    file) for the body text. Without ``font_path`` only installed fonts are
+    used."""
+    html_text = markdown(markdown_text, extras=["fenced-code-blocks"])
+    font_config = FontConfiguration()
+    css = CSS(
+        string=PDF_CSS.format(sources=_font_sources(font_path)),
+        font_config=font_config,
+    )
+    return HTML(string=html_text).write_pdf(stylesheets=[css], font_config=font_config)
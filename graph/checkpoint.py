@@ -0,0 +1,43 @@
+import os
+from contextlib import asynccontextmanager
+
+from langgraph.checkpoint.aiosqlite import AsyncSqliteSaver
+
+import conf.config as config
+
+
+@asynccontextmanager
+async def open_checkpointer(path: str = None):
+    path = path or config.CHECKPOINT_PATH
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    async with AsyncSqliteSaver.from_conn_string(path) as checkpointer:
+        await checkpointer.setup()
+        yield checkpointer
+
+
+def interview_thread_id(run_id: str, index: int) -> str:
+    return f"{run_id}/interview/{index}"
+
+
+async def delete_run(checkpointer, run_id: str):
+    """Forget every checkpoint of a run, including its interviews."""
+    await checkpointer.setup()
+    prefix = f"{run_id}/"
+    async with checkpointer.lock:
+        await checkpointer.conn.execute(
+            "DELETE FROM checkpoints"
+            " WHERE thread_id = ? OR substr(thread_id, 1, ?) = ?",
+            (run_id, len(prefix), prefix),
+        )
+        await checkpointer.conn.commit()
+
+
+async def ainvoke_resumable(graph, input, config):
+    """Run ``graph`` on the thread in ``config``, picking up from its last
+    checkpoint. A thread that already finished returns its final state."""
+    snapshot = await graph.aget_state(config)
+    if snapshot.values and not snapshot.next:
+        return snapshot.values
+    return await graph.ainvoke(None if snapshot.next else input, config)
@@ -1,14 +1,50 @@
+import logging
+
+import numpy as np
 from langchain_core.messages import AIMessage
 from langgraph.graph import END, StateGraph
 
+import conf.config as config
+from clients.registry import get_embeddings
 from modules.answer_questions import gen_answer
-from modules.dialog_roles import generate_question
+from modules.dialog_roles import drop_history, generate_question
 from state.interview_state import InterviewState
 
+logger = logging.getLogger(__name__)
+
 max_num_turns = 5
 
 
-def route_messages(state: InterviewState, name: str = "Subject_Matter_Expert"):
+async def information_gain(answers):
+    """How much the last answer adds over the earlier ones, from 0 to 1.
+
+    One minus the highest cosine similarity between the embedding of the last
+    answer and those of the earlier ones (citations left out). Earlier answers
+    come from the embedding cache, so each turn embeds one new text.
+    """
+    texts = [answer.partition("\n\nCitations:")[0] for answer in answers]
+    vectors = np.asarray(
+        await get_embeddings(config.INTERVIEW_GAIN_EMBEDDING_MODEL).aembed_documents(
+            texts
+        ),
+        dtype=np.float32,
+    )
+    norms = np.linalg.norm(vectors, axis=1)
+    norms[norms == 0] = 1.0
+    vectors /= norms[:, None]
+    similarity = float(np.max(vectors[:-1] @ vectors[-1]))
+    return min(1.0, max(0.0, 1.0 - similarity))
+
+
+async def route_messages(state: InterviewState, name: str = "Subject_Matter_Expert"):
+    route = await _next_step(state, name)
+    if route == END:
+        # 終わったインタビューの履歴は LRU に残さない
+        drop_history(state["messages"])
+    return route
+
+
+async def _next_step(state: InterviewState, name: str):
     messages = state["messages"]
     num_responses = len(
         [m for m in messages if isinstance(m, AIMessage) and m.name == name]
@@ -18,10 +54,29 @@ def route_messages(state: InterviewState, name: str = "Subject_Matter_Expert"):
     last_question = messages[-2]
     if last_question.content.endswith("Thank you so much for your help!"):
         return END
+    # 直近の回答がほとんど既出の内容なら、上限を待たずに打ち切る
+    # （messages[0] はインタビューの書き出しで、回答ではない）
+    answers = [
+        m.content for m in messages[1:] if isinstance(m, AIMessage) and m.name == name
+    ]
+    if config.INTERVIEW_ADAPTIVE_STOP and len(answers) >= max(
+        2, config.INTERVIEW_MIN_TURNS
+    ):
+        try:
+            gain = await information_gain(answers)
+        except Exception:
+            # 埋め込みが取れなくてもインタビューは続ける
+            logger.warning("could not embed answers for the stop check", exc_info=True)
+            return "ask_question"
+        if gain < config.INTERVIEW_MIN_GAIN:
+            logger.debug(
+                "ending interview after %d answers (gain %.2f)", len(answers), gain
+            )
+            return END
     return "ask_question"
 
 
-def get_interview_graph():
+def get_interview_graph(checkpointer=None):
     builder = StateGraph(InterviewState)
 
     builder.add_node("ask_question", generate_question)
@@ -30,7 +85,10 @@ def get_interview_graph():
     builder.add_edge("ask_question", "answer_question")
 
     builder.set_entry_point("ask_question")
-    interview_graph = builder.compile().with_config(run_name="Conduct Interviews")
+    # checkpointer があれば1ターンごとに InterviewState を保存する
+    interview_graph = builder.compile(checkpointer=checkpointer).with_config(
+        run_name="Conduct Interviews"
+    )
 
     return interview_graph
 
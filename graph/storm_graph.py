@@ -1,33 +1,57 @@
 import asyncio
 
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.vectorstores import SKLearnVectorStore
-from langchain_core.documents import Document
 from langchain_core.messages import AIMessage
 from langgraph.graph import StateGraph
 
+import conf.config as config
+from clients.registry import get_embeddings
+from graph.checkpoint import ainvoke_resumable, interview_thread_id
 from graph.interview_graph import get_interview_graph
-from modules.generate_final_article import get_writer_chain
+from modules.generate_final_article import (
+    assemble_article,
+    get_lead_chain,
+    get_writer_chain,
+    summarize_sections,
+)
 from modules.generate_initial_outline import get_generate_initial_outline_chain
 from modules.generate_perspectives import survey_subjects
 from modules.generate_sections import SectionWriter
-from modules.refine_outline import get_refine_outline_chain
+from modules.refine_outline import InterviewSummarizer, get_refine_outline_chain
+from retriever.numpy_vector_store import NumpyVectorStore
+from retriever.reference_indexer import ReferenceIndexer
+from scheduler.rate_limiter import Priority, priority
 from state.research_state import ResearchState
 
+# Names the UI filters on when streaming events (see app.py)
+SECTION_WRITER_RUN_NAME = "write_section"
+ARTICLE_WRITER_TAG = "article_writer"
+
 
 class STORMNode:
-    def __init__(self) -> None:
+    def __init__(self, checkpointer=None, assembly_mode=None) -> None:
+        self.checkpointer = checkpointer
+        self.assembly_mode = assembly_mode or config.ARTICLE_ASSEMBLY_MODE
         self.generate_outline_direct = get_generate_initial_outline_chain()
-        self.interview_graph = get_interview_graph()
+        self.interview_graph = get_interview_graph(checkpointer)
         self.refine_outline_chain = get_refine_outline_chain()
-        self.embeddings = OpenAIEmbeddings()
-        self.vectorstore = SKLearnVectorStore(embedding=self.embeddings)
-        self.section_writer = SectionWriter(self.vectorstore).get_section_writer_chain()
+        self.interview_summarizer = InterviewSummarizer()
+        self.embeddings = get_embeddings()
+        self.vectorstore = NumpyVectorStore(embedding=self.embeddings)
+        self.reference_indexer = ReferenceIndexer(self.vectorstore)
+        self.section_retriever = SectionWriter(self.vectorstore)
+        # Retrieval for all sections happens up front in write_sections
+        self.section_writer = self.section_retriever.get_section_writer_chain(
+            retrieve=False
+        ).with_config(run_name=SECTION_WRITER_RUN_NAME)
         self.refine_outline_chain = get_refine_outline_chain()
-        self.writer = get_writer_chain()
+        self.writer = get_writer_chain().with_config(tags=[ARTICLE_WRITER_TAG])
+        self.lead_writer = get_lead_chain().with_config(tags=[ARTICLE_WRITER_TAG])
 
     async def initialize_research(self, state: ResearchState):
         topic = state["topic"]
+        # 前回のトピックの参照文書を持ち越さない
+        self.reference_indexer.reset()
+        self.interview_summarizer.reset()
         self.initial_outline = self.generate_outline_direct.ainvoke({"topic": topic})
         coros = (
             self.initial_outline,
@@ -35,12 +59,11 @@ class STORMNode:
         )
         results = await asyncio.gather(*coros)
         return {
-            **state,
             "outline": results[0],
             "editors": results[1].editors,
         }
 
-    async def conduct_interviews(self, state: ResearchState):
+    async def conduct_interviews(self, state: ResearchState, config=None):
         topic = state["topic"]
         initial_states = [
             {
@@ -54,13 +77,37 @@ class STORMNode:
             }
             for editor in state["editors"]
         ]
-        # We call in to the sub-graph here to parallelize the interviews
-        interview_results = await self.interview_graph.abatch(initial_states)
+        # We call in to the sub-graph here to parallelize the interviews.
+        # Cited references are indexed as each answer comes in.
+        configurable = {"reference_indexer": self.reference_indexer}
+        run_id = ((config or {}).get("configurable") or {}).get("thread_id")
 
-        return {
-            **state,
-            "interview_results": interview_results,
-        }
+        async def interview(i, initial_state):
+            if self.checkpointer is not None and run_id is not None:
+                # Each interview is its own thread, so a resumed run only
+                # replays the turns that were not checkpointed yet.
+                result = await ainvoke_resumable(
+                    self.interview_graph,
+                    initial_state,
+                    {
+                        "configurable": {
+                            **configurable,
+                            "thread_id": interview_thread_id(run_id, i),
+                        }
+                    },
+                )
+            else:
+                result = await self.interview_graph.ainvoke(
+                    initial_state, {"configurable": configurable}
+                )
+            # Summaries for map-reduce refinement start as interviews finish
+            self.interview_summarizer.add(topic, self.format_conversation(result))
+            return result
+
+        interview_results = await asyncio.gather(
+            *(interview(i, s) for i, s in enumerate(initial_states))
+        )
+        return {"interview_results": interview_results}
 
     def format_conversation(self, interview_state):
         messages = interview_state["messages"]
@@ -68,12 +115,22 @@ class STORMNode:
         return f'Conversation with {interview_state["editor"].name}\n\n' + convo
 
     async def refine_outline(self, state: ResearchState):
-        convos = "\n\n".join(
-            [
-                self.format_conversation(interview_state)
-                for interview_state in state["interview_results"]
-            ]
+        conversations = [
+            self.format_conversation(interview_state)
+            for interview_state in state["interview_results"]
+        ]
+        # Too long for one call: refine from per-interview summaries instead
+        summaries = await self.interview_summarizer.summaries(
+            state["topic"], conversations
         )
+        if summaries is not None:
+            conversations = [
+                f'Notes from the conversation with {interview_state["editor"].name}\n\n{summary}'
+                for interview_state, summary in zip(
+                    state["interview_results"], summaries
+                )
+            ]
+        convos = "\n\n".join(conversations)
         updated_outline = await self.refine_outline_chain.ainvoke(
             {
                 "topic": state["topic"],
@@ -81,67 +138,181 @@ class STORMNode:
                 "conversations": convos,
             }
         )
-        return {**state, "outline": updated_outline}
+        return {"outline": updated_outline}
 
     async def index_references(self, state: ResearchState):
-        all_docs = []
+        # Most references were already indexed during the interviews;
+        # submit() skips those and retries any batch that failed.
+        await self.reference_indexer.drain()
         for interview_state in state["interview_results"]:
-            reference_docs = [
-                Document(page_content=v, metadata={"source": k})
-                for k, v in interview_state["references"].items()
-            ]
-            all_docs.extend(reference_docs)
-        await self.vectorstore.aadd_documents(all_docs)
-        return state
+            self.reference_indexer.submit(interview_state["references"])
+        await self.reference_indexer.drain(return_exceptions=False)
+        return {}
+
+    def section_k(self, section):
+        # Sections with more subsections get more references
+        k = config.SECTION_RETRIEVAL_K
+        extra = config.SECTION_RETRIEVAL_K_PER_SUBSECTION * len(
+            section.subsections or []
+        )
+        return min(2 * k, k + extra)
 
     async def write_sections(self, state: ResearchState):
         outline = state["outline"]
-        sections = await self.section_writer.abatch(
-            [
-                {
-                    "outline": outline.as_str,
-                    "section": section.section_title,
-                    "topic": state["topic"],
-                }
-                for section in outline.sections
-            ]
-        )
-        return {
-            **state,
-            "sections": sections,
-        }
+        # A run resumed from a checkpoint starts with an empty vector store
+        if not len(self.vectorstore):
+            await self.index_references(state)
+        inputs = [
+            {
+                "outline": outline.as_str,
+                "section": section.section_title,
+                "topic": state["topic"],
+            }
+            for section in outline.sections
+        ]
+        with priority(Priority.HIGH):
+            inputs = await self.section_retriever.retrieve_many(
+                inputs,
+                k=[self.section_k(section) for section in outline.sections],
+                lambda_mult=config.SECTION_RETRIEVAL_MMR_LAMBDA,
+            )
+            sections = await self.section_writer.abatch(inputs)
+        return {"sections": sections}
 
     async def write_article(self, state: ResearchState):
         topic = state["topic"]
         sections = state["sections"]
+        if self.assembly_mode == "local":
+            article = await self.assemble_article(state)
+            return {"article": article}
+
         draft = "\n\n".join([section.as_str for section in sections])
-        article = await self.writer.ainvoke({"topic": topic, "draft": draft})
-        return {
-            **state,
-            "article": article,
+        # The final article is on the critical path; let it jump the queue
+        with priority(Priority.CRITICAL):
+            article = await self.writer.ainvoke({"topic": topic, "draft": draft})
+        return {"article": article}
+
+    async def assemble_article(self, state: ResearchState):
+        # Sections are used as written; only the lead paragraph goes to the LLM
+        sections = state["sections"]
+        lead = None
+        if config.ARTICLE_LEAD_PARAGRAPH:
+            with priority(Priority.CRITICAL):
+                lead = await self.lead_writer.ainvoke(
+                    {"topic": state["topic"], "summary": summarize_sections(sections)}
+                )
+        return assemble_article(state["outline"].page_title, sections, lead)
+
+
+# (node, keys it reads, keys it writes). "reference_index" is the vector
+# store, which lives outside ResearchState but orders the nodes all the same.
+STORM_STAGES = [
+    ("init_research", ("topic",), ("outline", "editors")),
+    (
+        "conduct_interviews",
+        ("topic", "editors"),
+        ("interview_results", "reference_index"),
+    ),
+    ("refine_outline", ("topic", "outline", "interview_results"), ("outline",)),
+    (
+        "index_references",
+        ("interview_results", "reference_index"),
+        ("reference_index",),
+    ),
+    ("write_sections", ("topic", "outline", "reference_index"), ("sections",)),
+    ("write_article", ("topic", "outline", "sections"), ("article",)),
+]
+
+
+def stage_dependencies(stages=STORM_STAGES):
+    """Map each node to the nodes it has to wait for.
+
+    A node depends on the latest earlier node writing each key it reads;
+    dependencies already implied through another dependency are dropped.
+    """
+    writers = {}
+    direct = {}
+    for name, reads, writes in stages:
+        direct[name] = {writers[key] for key in reads if key in writers}
+        for key in writes:
+            writers[key] = name
+
+    ancestors = {}
+    for name, _, _ in stages:
+        ancestors[name] = set().union(*({dep} | ancestors[dep] for dep in direct[name]))
+    return {
+        name: {
+            dep
+            for dep in deps
+            if not any(dep in ancestors[other] for other in deps - {dep})
         }
+        for name, deps in direct.items()
+    }
+
+
+STORM_DEPENDENCIES = stage_dependencies()
+
+
+def critical_path(spans, dependencies=STORM_DEPENDENCIES):
+    """Chain of node spans that determined the run's wall time.
+
+    Starting from the node that finished last, repeatedly step to the
+    dependency that finished last. ``spans`` are (name, start, end).
+    """
+    last = {}
+    for span in spans:
+        if span[0] in dependencies and (
+            span[0] not in last or span[2] > last[span[0]][2]
+        ):
+            last[span[0]] = span
+    if not last:
+        return []
+    path = [max(last.values(), key=lambda s: s[2])]
+    while True:
+        deps = [last[dep] for dep in dependencies[path[-1][0]] if dep in last]
+        if not deps:
+            break
+        path.append(max(deps, key=lambda s: s[2]))
+    return [(name, end - start) for name, start, end in reversed(path)]
+
+
+def format_critical_path(path):
+    return " -> ".join(f"{name}({seconds:.2f}s)" for name, seconds in path)
+
 
+def get_storm_graph(checkpointer=None, assembly_mode=None):
+    """With a checkpointer, ``ResearchState`` is saved after every node and
+    runs can be resumed by passing the same ``thread_id``.
 
-def get_storm_graph():
+    Edges come from ``STORM_STAGES``: nodes without a dependency between
+    them (refine_outline and index_references) run in parallel.
+    """
     builder_of_storm = StateGraph(ResearchState)
-    storm_node = STORMNode()
-    nodes = [
-        ("init_research", storm_node.initialize_research),
-        ("conduct_interviews", storm_node.conduct_interviews),
-        ("refine_outline", storm_node.refine_outline),
-        ("index_references", storm_node.index_references),
-        ("write_sections", storm_node.write_sections),
-        ("write_article", storm_node.write_article),
-    ]
-    for i in range(len(nodes)):
-        name, node = nodes[i]
+    storm_node = STORMNode(checkpointer, assembly_mode)
+    nodes = {
+        "init_research": storm_node.initialize_research,
+        "conduct_interviews": storm_node.conduct_interviews,
+        "refine_outline": storm_node.refine_outline,
+        "index_references": storm_node.index_references,
+        "write_sections": storm_node.write_sections,
+        "write_article": storm_node.write_article,
+    }
+    for name, node in nodes.items():
         builder_of_storm.add_node(name, node)
-        if i > 0:
-            builder_of_storm.add_edge(nodes[i - 1][0], name)
 
-    builder_of_storm.set_entry_point(nodes[0][0])
-    builder_of_storm.set_finish_point(nodes[-1][0])
-    storm = builder_of_storm.compile()
+    dependents = set()
+    for name, deps in STORM_DEPENDENCIES.items():
+        dependents.update(deps)
+        if len(deps) == 1:
+            builder_of_storm.add_edge(next(iter(deps)), name)
+        elif deps:
+            # 複数の依存先がすべて終わってから実行する
+            builder_of_storm.add_edge(sorted(deps), name)
+        else:
+            builder_of_storm.set_entry_point(name)
+    for name in STORM_DEPENDENCIES.keys() - dependents:
+        builder_of_storm.set_finish_point(name)
+    storm = builder_of_storm.compile(checkpointer=checkpointer)
 
     return storm
 
@@ -1,27 +1,72 @@
+import argparse
 import asyncio
+import logging
 import sys
+from contextlib import AsyncExitStack
 
-from graph.storm_graph import get_storm_graph
+import conf.config as config
+from clients import registry_scope
+from graph.checkpoint import open_checkpointer
+from graph.storm_graph import critical_path, format_critical_path, get_storm_graph
+from metrics import MetricsCallbackHandler, get_metrics, start_metrics_server
 
+logger = logging.getLogger(__name__)
 
-async def main():
-    storm = get_storm_graph()
-    results = None
-    async for step in storm.astream(
-        {
-            "topic": "Impact of million-plus token context window language models on RAG",
-        }
-    ):
-        name = next(iter(step))
-        print(name)
-        print("-- ", str(step[name])[:300])
-        results = step
+DEFAULT_TOPIC = "Impact of million-plus token context window language models on RAG"
+
+
+async def main(topic=DEFAULT_TOPIC, run_id=None):
+    handler = MetricsCallbackHandler()
+    run_config = {"callbacks": [handler]}
+    inputs = {"topic": topic}
+    async with AsyncExitStack() as stack:
+        await stack.enter_async_context(registry_scope())
+        checkpointer = None
+        if run_id:
+            checkpointer = await stack.enter_async_context(open_checkpointer())
+            run_config["configurable"] = {"thread_id": run_id}
+        storm = get_storm_graph(checkpointer)
+
+        article = None
+        if checkpointer is not None:
+            snapshot = await storm.aget_state(run_config)
+            if snapshot.next:
+                logger.info("resuming %s at %s", run_id, ", ".join(snapshot.next))
+                inputs = None
+            elif snapshot.values:
+                logger.info("%s already finished", run_id)
+                article = snapshot.values["article"]
+
+        if article is None:
+            results = None
+            async for step in storm.astream(inputs, run_config):
+                name = next(iter(step))
+                logger.info(name)
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("-- %s", str(step[name])[:300])
+                results = step
+            article = results["write_article"]["article"]
 
-    article = results["write_article"]["article"]
     print(article)
+    if handler.spans:
+        logger.info(
+            "critical path: %s", format_critical_path(critical_path(handler.spans))
+        )
+    logger.debug("metrics: %s", get_metrics().snapshot())
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--topic", default=DEFAULT_TOPIC)
+    parser.add_argument(
+        "--run-id",
+        help="checkpoint every node under this id; rerun with the same id to resume",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=config.LOG_LEVEL)
+    if config.METRICS_PORT:
+        start_metrics_server(config.METRICS_PORT)
     if sys.platform.startswith("win"):
         asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
-    asyncio.run(main())
+    asyncio.run(main(args.topic, args.run_id))
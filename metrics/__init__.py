@@ -0,0 +1,3 @@
+from .callbacks import INTERVIEW_NODES, STORM_NODES, MetricsCallbackHandler
+from .recorder import MetricsRecorder, get_metrics
+from .server import start_metrics_server
@@ -0,0 +1,128 @@
+import time
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import AsyncCallbackHandler
+from langchain_core.outputs import LLMResult
+
+from .recorder import get_metrics
+
+STORM_NODES = {
+    "init_research",
+    "conduct_interviews",
+    "refine_outline",
+    "index_references",
+    "write_sections",
+    "write_article",
+}
+INTERVIEW_NODES = {"ask_question", "answer_question"}
+
+
+class MetricsCallbackHandler(AsyncCallbackHandler):
+    """Records graph node timings and LLM calls for every run it is passed to.
+
+    Cache hits are the generations marked by ``SQLiteLLMCache``; token counts
+    come from the messages' ``usage_metadata`` so streamed calls are counted too.
+    Completed node spans are also kept in ``spans`` as (name, start, end).
+    """
+
+    def __init__(self, node_names=STORM_NODES | INTERVIEW_NODES, recorder=None):
+        self.node_names = node_names
+        self.recorder = recorder or get_metrics()
+        self.spans = []
+        self._nodes = {}
+        self._llm_runs = {}
+
+    async def on_chain_start(
+        self,
+        serialized: Dict[str, Any],
+        inputs: Any,
+        *,
+        run_id: UUID,
+        name: Optional[str] = None,
+        **kwargs: Any
+    ) -> None:
+        name = name or (serialized or {}).get("name")
+        if name in self.node_names:
+            self._nodes[run_id] = (name, time.perf_counter())
+
+    async def on_chain_end(self, outputs: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        if run_id in self._nodes:
+            name, start = self._nodes.pop(run_id)
+            end = time.perf_counter()
+            self.spans.append((name, start, end))
+            self.recorder.record("node", name, end - start)
+
+    async def on_chain_error(
+        self, error: BaseException, *, run_id: UUID, **kwargs: Any
+    ) -> None:
+        if run_id in self._nodes:
+            name, start = self._nodes.pop(run_id)
+            self.recorder.record(
+                "node", name, time.perf_counter() - start, error=type(error).__name__
+            )
+
+    async def on_chat_model_start(
+        self,
+        serialized: Dict[str, Any],
+        messages: List[List[Any]],
+        *,
+        run_id: UUID,
+        **kwargs: Any
+    ) -> None:
+        params = kwargs.get("invocation_params") or {}
+        model = (
+            params.get("model")
+            or params.get("model_name")
+            or (kwargs.get("metadata") or {}).get("ls_model_name")
+            or "unknown"
+        )
+        payload = sum(
+            len(str(m.content).encode("utf-8")) for batch in messages for m in batch
+        )
+        self._llm_runs[run_id] = (model, time.perf_counter(), payload, 0)
+
+    async def on_retry(self, retry_state: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        if run_id in self._llm_runs:
+            model, start, payload, retries = self._llm_runs[run_id]
+            self._llm_runs[run_id] = (model, start, payload, retries + 1)
+
+    async def on_llm_end(
+        self, response: LLMResult, *, run_id: UUID, **kwargs: Any
+    ) -> None:
+        if run_id not in self._llm_runs:
+            return
+        model, start, payload, retries = self._llm_runs.pop(run_id)
+        generations = [g for batch in response.generations for g in batch]
+        cache_hit = any((g.generation_info or {}).get("cache_hit") for g in generations)
+        prompt_tokens = completion_tokens = 0
+        if not cache_hit:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                usage = getattr(message, "usage_metadata", None) or {}
+                prompt_tokens += usage.get("input_tokens", 0)
+                completion_tokens += usage.get("output_tokens", 0)
+        self.recorder.record(
+            "llm",
+            model,
+            time.perf_counter() - start,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            payload_bytes=payload,
+            retries=retries,
+            cache_hit=cache_hit,
+        )
+
+    async def on_llm_error(
+        self, error: BaseException, *, run_id: UUID, **kwargs: Any
+    ) -> None:
+        if run_id in self._llm_runs:
+            model, start, payload, retries = self._llm_runs.pop(run_id)
+            self.recorder.record(
+                "llm",
+                model,
+                time.perf_counter() - start,
+                payload_bytes=payload,
+                retries=retries,
+                error=type(error).__name__,
+            )
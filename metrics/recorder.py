@@ -0,0 +1,167 @@
+import json
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Optional
+
+import conf.config as config
+
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+class MetricsRecorder:
+    """Collects per-call metrics for nodes and external calls.
+
+    Every record updates Prometheus-style counters and latency histograms and,
+    if ``jsonl_path`` is set, is appended to that file as one JSON line.
+    """
+
+    def __init__(self, jsonl_path: Optional[str] = None):
+        self.jsonl_path = jsonl_path
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)
+        self._gauges = {}
+        self._histograms = {}
+
+    def record(
+        self,
+        kind: str,
+        name: str,
+        latency_s: Optional[float] = None,
+        *,
+        prompt_tokens: int = 0,
+        completion_tokens: int = 0,
+        payload_bytes: int = 0,
+        retries: int = 0,
+        cache_hit: Optional[bool] = None,
+        error: Optional[str] = None,
+        **extra,
+    ):
+        labels = (("kind", kind), ("name", name))
+        cache = "none" if cache_hit is None else ("hit" if cache_hit else "miss")
+        status = "error" if error else "ok"
+        with self._lock:
+            self._counters[
+                ("storm_calls_total", labels + (("cache", cache), ("status", status)))
+            ] += 1
+            if prompt_tokens:
+                self._counters[
+                    ("storm_tokens_total", labels + (("type", "prompt"),))
+                ] += prompt_tokens
+            if completion_tokens:
+                self._counters[
+                    ("storm_tokens_total", labels + (("type", "completion"),))
+                ] += completion_tokens
+            if payload_bytes:
+                self._counters[("storm_payload_bytes_total", labels)] += payload_bytes
+            if retries:
+                self._counters[("storm_retries_total", labels)] += retries
+            if latency_s is not None:
+                histogram = self._histograms.setdefault(
+                    labels, [[0] * (len(LATENCY_BUCKETS) + 1), 0.0, 0]
+                )
+                histogram[0][bisect_left(LATENCY_BUCKETS, latency_s)] += 1
+                histogram[1] += latency_s
+                histogram[2] += 1
+            if self.jsonl_path:
+                entry = {
+                    "ts": time.time(),
+                    "kind": kind,
+                    "name": name,
+                    "latency_s": latency_s,
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "payload_bytes": payload_bytes,
+                    "retries": retries,
+                    "cache_hit": cache_hit,
+                    "error": error,
+                    **extra,
+                }
+                with open(self.jsonl_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def set_gauge(self, metric: str, value: float, **labels):
+        """Current value of e.g. a queue depth (not written to the JSONL log)."""
+        with self._lock:
+            self._gauges[(metric, tuple(sorted(labels.items())))] = value
+
+    @contextmanager
+    def timed(self, kind: str, name: str, **fields):
+        """Time a block; the yielded dict can be filled with record() fields."""
+        start = time.perf_counter()
+        try:
+            yield fields
+        except Exception as e:
+            fields["error"] = type(e).__name__
+            raise
+        finally:
+            self.record(kind, name, time.perf_counter() - start, **fields)
+
+    @staticmethod
+    def _labels(labels, extra=()):
+        pairs = [f'{k}="{v}"' for k, v in labels + tuple(extra)]
+        return "{" + ",".join(pairs) + "}"
+
+    def render_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            seen = set()
+            for (metric, labels), value in sorted(self._counters.items()):
+                if metric not in seen:
+                    lines.append(f"# TYPE {metric} counter")
+                    seen.add(metric)
+                lines.append(f"{metric}{self._labels(labels)} {value:g}")
+            seen = set()
+            for (metric, labels), value in sorted(self._gauges.items()):
+                if metric not in seen:
+                    lines.append(f"# TYPE {metric} gauge")
+                    seen.add(metric)
+                lines.append(f"{metric}{self._labels(labels)} {value:g}")
+            if self._histograms:
+                lines.append("# TYPE storm_latency_seconds histogram")
+            for labels, (buckets, total, count) in sorted(self._histograms.items()):
+                cumulative = 0
+                for bound, n in zip(LATENCY_BUCKETS + ("+Inf",), buckets):
+                    cumulative += n
+                    lines.append(
+                        f"storm_latency_seconds_bucket{self._labels(labels, [('le', bound)])} {cumulative}"
+                    )
+                lines.append(
+                    f"storm_latency_seconds_sum{self._labels(labels)} {total:g}"
+                )
+                lines.append(
+                    f"storm_latency_seconds_count{self._labels(labels)} {count}"
+                )
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "counters": {
+                    f"{metric}{self._labels(labels)}": value
+                    for (metric, labels), value in self._counters.items()
+                },
+                "gauges": {
+                    f"{metric}{self._labels(labels)}": value
+                    for (metric, labels), value in self._gauges.items()
+                },
+                "latency": {
+                    f"{kind}:{name}": {
+                        "count": count,
+                        "avg_s": total / count if count else 0.0,
+                    }
+                    for ((_, kind), (_, name)), (
+                        _,
+                        total,
+                        count,
+                    ) in self._histograms.items()
+                },
+            }
+
+
+@lru_cache(maxsize=None)
+def get_metrics() -> MetricsRecorder:
+    return MetricsRecorder(jsonl_path=config.METRICS_JSONL_PATH or None)
@@ -1,7 +1,7 @@
 from .answer_questions import AnswerWithCitations, Queries, gen_answer, search_engine
-from .dialog_roles import generate_question, get_question, swap_roles
+from .dialog_roles import compact_history, generate_question, get_question, swap_roles
 from .expand_topics import RelatedSubjects, get_related_subjects
-from .generate_final_article import get_writer_chain
+from .generate_final_article import assemble_article, get_lead_chain, get_writer_chain
 from .generate_initial_outline import Outline, get_initial_outline
 from .generate_perspectives import Editor, Perspectives, survey_subjects
 from .generate_sections import SectionWriter
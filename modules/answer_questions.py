@@ -1,19 +1,23 @@
 import asyncio
-import json
+import logging
 import sys
 from typing import List, Optional
 
-from langchain_community.utilities.duckduckgo_search import DuckDuckGoSearchAPIWrapper
 from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.pydantic_v1 import BaseModel, Field
 from langchain_core.runnables import RunnableConfig
 from langchain_core.tools import tool
-from langchain_openai import ChatOpenAI
 
-from .dialog_roles import get_question, swap_roles
+from cache.search_cache import get_search_cache
+from clients.registry import cached_chain, get_chat_model, get_search_backend
+from metrics.recorder import get_metrics
+from .context_packer import pack_context
+from .dialog_roles import compact_history, get_question, swap_roles
 from state.interview_state import InterviewState
 
+logger = logging.getLogger(__name__)
+
 
 class Queries(BaseModel):
     queries: List[str] = Field(
@@ -39,11 +43,22 @@ class AnswerWithCitations(BaseModel):
 @tool
 async def search_engine(query: str):
     """Search engine to the internet."""
-    results = DuckDuckGoSearchAPIWrapper()._ddgs_text(query)
-    return [{"content": r["body"], "url": r["href"]} for r in results]
-
-
-def get_gen_queries_chain():
+    backend = get_search_backend()
+    search_cache = get_search_cache() if getattr(backend, "cacheable", True) else None
+    with get_metrics().timed("search", "search_engine") as fields:
+        results = search_cache.get(query) if search_cache else None
+        fields["cache_hit"] = results is not None
+        if results is None:
+            results = await backend(query)
+            # 空の結果はレート制限の可能性があるのでキャッシュしない
+            if results and search_cache:
+                search_cache.set(query, results)
+        fields["payload_bytes"] = sum(len(r["content"]) for r in results)
+    return results
+
+
+@cached_chain
+def get_gen_queries_chain(cache: bool = True):
     gen_queries_prompt = ChatPromptTemplate.from_messages(
         [
             (
@@ -53,14 +68,15 @@ def get_gen_queries_chain():
             MessagesPlaceholder(variable_name="messages", optional=True),
         ]
     )
-    gen_queries_chain = gen_queries_prompt | ChatOpenAI(
-        model="gpt-3.5-turbo"
+    gen_queries_chain = gen_queries_prompt | get_chat_model(
+        "gpt-3.5-turbo", cache=cache
     ).with_structured_output(Queries, include_raw=True)
 
     return gen_queries_chain
 
 
-def get_gen_answer_chain():
+@cached_chain
+def get_gen_answer_chain(cache: bool = True):
     gen_answer_prompt = ChatPromptTemplate.from_messages(
         [
             (
@@ -74,7 +90,7 @@ def get_gen_answer_chain():
             MessagesPlaceholder(variable_name="messages", optional=True),
         ]
     )
-    llm = ChatOpenAI(model="gpt-4o-2024-05-13", temperature=0)
+    llm = get_chat_model("gpt-4o-2024-05-13", cache=cache, temperature=0)
     gen_answer_chain = gen_answer_prompt | llm.with_structured_output(
         AnswerWithCitations, include_raw=True
     ).with_config(run_name="GenerateAnswer")
@@ -86,26 +102,26 @@ async def gen_answer(
     state: InterviewState,
     config: Optional[RunnableConfig] = None,
     name: str = "Subject_Matter_Expert",
-    max_str_len: int = 15000,
+    max_context_tokens: int = 4000,
 ):
+    await compact_history(state)
     swapped_state = swap_roles(state, name)  # Convert all other AI messages
     gen_queries_chain = get_gen_queries_chain()
     queries = await gen_queries_chain.ainvoke(swapped_state)
     query_results = await search_engine.abatch(
         queries["parsed"].queries, config, return_exceptions=True
     )
-    print("query_results:", query_results)
-    print()
+    logger.debug("query_results: %s", query_results)
     successful_results = [
         res for res in query_results if not isinstance(res, Exception)
     ]
     all_query_results = {
         res["url"]: res["content"] for results in successful_results for res in results
     }
-    print("all_query_results:", all_query_results)
-    print()
-    # We could be more precise about handling max token length if we wanted to here
-    dumped = json.dumps(all_query_results)[:max_str_len]
+    logger.debug("all_query_results: %s", all_query_results)
+    # Keep whole, de-duplicated results, most relevant to the question first
+    question = swapped_state["messages"][-1].content
+    dumped = pack_context(all_query_results, question, max_context_tokens)
     ai_message: AIMessage = queries["raw"]
     tool_call = queries["raw"].additional_kwargs["tool_calls"][0]
     tool_id = tool_call["id"]
@@ -126,8 +142,11 @@ async def gen_answer(
     cited_urls = set(generated["parsed"].cited_urls)
     # Save the retrieved information to a the shared state for future reference
     cited_references = {k: v for k, v in all_query_results.items() if k in cited_urls}
-    print("cited_references:", cited_references)
-    print()
+    # Start embedding the references while the interviews keep running
+    reference_indexer = (config or {}).get("configurable", {}).get("reference_indexer")
+    if reference_indexer is not None:
+        reference_indexer.submit(cited_references)
+    logger.debug("cited_references: %s", cited_references)
     formatted_message = AIMessage(name=name, content=generated["parsed"].as_str)
     return {"messages": [formatted_message], "references": cited_references}
 
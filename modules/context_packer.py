@@ -0,0 +1,105 @@
+import json
+import math
+import re
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+import tiktoken
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+@lru_cache(maxsize=None)
+def _encoding(model: str):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        # tiktoken は初回にエンコーディングをダウンロードする（オフラインでは失敗する）
+        return None
+
+
+def count_tokens(text: str, model: str = "gpt-4o") -> int:
+    encoding = _encoding(model)
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def _terms(text: str) -> List[str]:
+    return _WORD.findall(text.casefold())
+
+
+def _shingles(terms: List[str], size: int = 5) -> set:
+    if len(terms) < size:
+        return {" ".join(terms)}
+    return {" ".join(terms[i : i + size]) for i in range(len(terms) - size + 1)}
+
+
+def shingles(text: str, size: int = 5) -> set:
+    """Word n-grams of ``text``, casefolded."""
+    return _shingles(_terms(text), size)
+
+
+def _jaccard(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def rank_snippets(
+    snippets: Dict[str, str], question: str, k1: float = 1.5, b: float = 0.75
+) -> List[Tuple[str, str]]:
+    """Order snippets by BM25 score against the question (ties keep input order)."""
+    docs = [(url, content, _terms(content)) for url, content in snippets.items()]
+    if not docs:
+        return []
+    query = set(_terms(question))
+    avg_len = sum(len(terms) for _, _, terms in docs) / len(docs) or 1.0
+    df = Counter(term for _, _, terms in docs for term in set(terms) & query)
+    idf = {
+        term: math.log(1 + (len(docs) - n + 0.5) / (n + 0.5)) for term, n in df.items()
+    }
+
+    def score(terms):
+        tf = Counter(t for t in terms if t in idf)
+        norm = k1 * (1 - b + b * len(terms) / avg_len)
+        return sum(idf[t] * f * (k1 + 1) / (f + norm) for t, f in tf.items())
+
+    scored = [
+        (score(terms), i, url, content) for i, (url, content, terms) in enumerate(docs)
+    ]
+    scored.sort(key=lambda x: (-x[0], x[1]))
+    return [(url, content) for _, _, url, content in scored]
+
+
+def pack_context(
+    snippets: Dict[str, str],
+    question: str,
+    max_tokens: int,
+    dedup_threshold: float = 0.8,
+    model: str = "gpt-4o",
+) -> str:
+    """Serialize the most relevant snippets as a JSON object within a token budget.
+
+    Snippets are ranked against ``question``; near-duplicates of a snippet that
+    was already kept are dropped, and only whole entries are added, so the
+    result is always valid JSON.
+    """
+    packed = {}
+    kept_shingles = []
+    used = 2  # "{}"
+    for url, content in rank_snippets(snippets, question):
+        shingles = _shingles(_terms(content))
+        if any(_jaccard(shingles, seen) >= dedup_threshold for seen in kept_shingles):
+            continue
+        cost = count_tokens(json.dumps({url: content}), model)
+        if used + cost > max_tokens:
+            # 大きすぎる項目は飛ばして、後続の小さい項目で予算を埋める
+            continue
+        packed[url] = content
+        kept_shingles.append(shingles)
+        used += cost
+    return json.dumps(packed)
@@ -1,34 +1,145 @@
 import asyncio
 import sys
+from collections import OrderedDict
 
 from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_core.runnables import RunnableLambda
 from langchain_core.runnables import chain as as_runnable
-from langchain_openai import ChatOpenAI
 
+import conf.config as config
+from clients.registry import cached_chain, get_chat_model
+from .context_packer import count_tokens
 from .generate_perspectives import survey_subjects
 from state.interview_state import InterviewState
 
+# 同時に保持するインタビュー数の上限
+MAX_CACHED_INTERVIEWS = 256
+
 
 def tag_with_name(ai_message: AIMessage, name: str):
     ai_message.name = name
     return ai_message
 
 
+def _swap(message, name: str):
+    if isinstance(message, AIMessage) and message.name != name:
+        return HumanMessage(**message.dict(exclude={"type"}))
+    return message
+
+
+class InterviewHistory:
+    """Per-role views of one interview's messages, extended incrementally.
+
+    The graph state holds the same message objects from turn to turn, so a
+    view only has to convert the messages appended since the last call.
+    Turns covered by ``summary`` are left out of the views.
+    """
+
+    def __init__(self):
+        self.messages = []
+        self.tokens = []
+        self.views = {}
+        self.summary = None
+        # 要約済みのメッセージ数（冒頭のメッセージは除く）
+        self.summarized = 0
+
+    def extend(self, messages) -> bool:
+        n = len(self.messages)
+        if len(messages) < n or (n and messages[n - 1] is not self.messages[n - 1]):
+            return False
+        for message in messages[n:]:
+            self.messages.append(message)
+            self.tokens.append(count_tokens(str(message.content)))
+        return True
+
+    def view(self, name: str) -> list:
+        converted = self.views.setdefault(name, [])
+        for message in self.messages[len(converted) :]:
+            converted.append(_swap(message, name))
+        if not converted or not self.summary:
+            return list(converted)
+        opening = converted[0]
+        opening = opening.copy(
+            update={
+                "content": f"{opening.content}\n\n"
+                f"Summary of the conversation so far:\n{self.summary}"
+            }
+        )
+        return [opening, *converted[1 + self.summarized :]]
+
+    async def compact(self, max_tokens: int, keep_turns: int):
+        """Fold the oldest question/answer pairs into the running summary
+        once the unsummarized transcript exceeds ``max_tokens``."""
+        start = 1 + self.summarized
+        if sum(self.tokens[start:]) <= max_tokens:
+            return
+        cut = len(self.messages) - start - 2 * keep_turns
+        cut -= cut % 2
+        if cut <= 0:
+            return
+        transcript = "\n\n".join(
+            f"{m.name}: {m.content}" for m in self.messages[start : start + cut]
+        )
+        self.summary = await get_summarize_history_chain().ainvoke(
+            {"summary": self.summary or "(none)", "transcript": transcript}
+        )
+        self.summarized += cut
+
+
+_histories = OrderedDict()
+
+
+def get_history(messages) -> InterviewHistory:
+    # 冒頭のメッセージはインタビューごとに別オブジェクトなので、その id で引く
+    key = id(messages[0]) if messages else None
+    history = _histories.get(key)
+    if history is None or not history.extend(messages):
+        history = InterviewHistory()
+        history.extend(messages)
+        _histories[key] = history
+    _histories.move_to_end(key)
+    while len(_histories) > MAX_CACHED_INTERVIEWS:
+        _histories.popitem(last=False)
+    return history
+
+
+def drop_history(messages):
+    """Forget the cached history of a finished interview."""
+    _histories.pop(id(messages[0]) if messages else None, None)
+
+
 def swap_roles(state: InterviewState, name: str):
-    converted = []
-    for message in state["messages"]:
-        if isinstance(message, AIMessage) and message.name != name:
-            message = HumanMessage(**message.dict(exclude={"type"}))
-        converted.append(message)
-    return {"messages": converted}
+    return {"messages": get_history(state["messages"]).view(name)}
 
 
-@as_runnable
-async def generate_question(state: InterviewState):
-    editor = state["editor"]
-    llm = ChatOpenAI(model="gpt-4o-2024-05-13", temperature=0)
+async def compact_history(state: InterviewState):
+    if config.INTERVIEW_COMPACT_TOKENS:
+        await get_history(state["messages"]).compact(
+            config.INTERVIEW_COMPACT_TOKENS, config.INTERVIEW_COMPACT_KEEP_TURNS
+        )
+
+
+@cached_chain
+def get_summarize_history_chain(cache: bool = True):
+    summarize_prompt = ChatPromptTemplate.from_messages(
+        [
+            (
+                "system",
+                "You keep a running summary of an interview between a Wikipedia writer and a subject matter expert."
+                " Update the summary with the new part of the transcript. Keep every fact, figure, question already"
+                " asked and cited URL; drop small talk.\n\nCurrent summary:\n{summary}",
+            ),
+            ("user", "New part of the transcript:\n\n{transcript}"),
+        ]
+    )
+    llm = get_chat_model("gpt-3.5-turbo", cache=cache, temperature=0)
+    return summarize_prompt | llm | StrOutputParser()
+
+
+@cached_chain
+def get_gen_question_chain(cache: bool = True):
+    llm = get_chat_model("gpt-4o-2024-05-13", cache=cache, temperature=0)
     gen_qn_prompt = ChatPromptTemplate.from_messages(
         [
             (
@@ -49,14 +160,21 @@ async def generate_question(state: InterviewState):
             MessagesPlaceholder(variable_name="messages", optional=True),
         ]
     )
-    gn_chain = (
-        RunnableLambda(swap_roles).bind(name=editor.name)
-        | gen_qn_prompt.partial(persona=editor.persona)
-        | llm
-        | RunnableLambda(tag_with_name).bind(name=editor.name)
+    gn_chain = gen_qn_prompt | llm
+
+    return gn_chain
+
+
+@as_runnable
+async def generate_question(state: InterviewState):
+    editor = state["editor"]
+    await compact_history(state)
+    # The prompt and model are built once; the persona is passed per call
+    swapped_state = swap_roles(state, editor.name)
+    result = await get_gen_question_chain().ainvoke(
+        {**swapped_state, "persona": editor.persona}
     )
-    result = await gn_chain.ainvoke(state)
-    return {"messages": [result]}
+    return {"messages": [tag_with_name(result, editor.name)]}
 
 
 async def get_question(topic):
@@ -1,12 +1,19 @@
+import re
 from typing import List, Optional
 
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.pydantic_v1 import BaseModel, Field
-from langchain_openai import ChatOpenAI
 
+from clients.registry import cached_chain, get_chat_model
 
-def get_writer_chain():
+_MARKER = re.compile(r"\[(\d+)\]")
+_LEADING_MARKER = re.compile(r"\s*\[\d+\]")
+_URL = re.compile(r"https?://\S+")
+
+
+@cached_chain
+def get_writer_chain(cache: bool = True):
     writer_prompt = ChatPromptTemplate.from_messages(
         [
             (
@@ -21,7 +28,98 @@ def get_writer_chain():
             ),
         ]
     )
-    llm = ChatOpenAI(model="gpt-4o-2024-05-13", temperature=0)
+    llm = get_chat_model("gpt-4o-2024-05-13", cache=cache, temperature=0)
     writer = writer_prompt | llm | StrOutputParser()
 
     return writer
+
+
+@cached_chain
+def get_lead_chain(cache: bool = True):
+    lead_prompt = ChatPromptTemplate.from_messages(
+        [
+            (
+                "system",
+                "You are an expert Wikipedia author. Write the lead section of the wiki article on {topic}."
+                " The article has the following sections:\n\n{summary}",
+            ),
+            (
+                "user",
+                "Write one or two plain paragraphs that summarize the topic and the article."
+                " Do not use headings, markdown formatting or citations.",
+            ),
+        ]
+    )
+    llm = get_chat_model("gpt-4o-2024-05-13", cache=cache, temperature=0)
+    return lead_prompt | llm | StrOutputParser()
+
+
+def summarize_sections(sections) -> str:
+    """Section titles with their first paragraph, as input for the lead."""
+    parts = []
+    for section in sections:
+        first_paragraph = section.content.strip().split("\n\n")[0]
+        parts.append(
+            f"## {section.section_title}\n{_LEADING_MARKER.sub('', first_paragraph)}"
+        )
+    return "\n\n".join(parts)
+
+
+def _citation_key(citation: str) -> str:
+    url = _URL.search(citation)
+    if url:
+        return url.group(0).rstrip(".,;)").rstrip("/")
+    return " ".join(citation.split()).casefold()
+
+
+def _section_body(section) -> str:
+    parts = [section.content.strip()]
+    parts.extend(subsection.as_str for subsection in section.subsections or [])
+    return "\n\n".join(part for part in parts if part)
+
+
+def assemble_article(title: str, sections, lead: Optional[str] = None) -> str:
+    """Build the final markdown article from the written sections.
+
+    Each section numbers its own ``citations``; markers like ``[2]`` are
+    rewritten to one article-wide footnote list in order of first use, with
+    the same source (by URL) sharing a number. Markers that point at no
+    citation are dropped.
+    """
+    footnotes: List[str] = []
+    numbers = {}
+
+    def number_of(citation: str) -> int:
+        key = _citation_key(citation)
+        if key not in numbers:
+            footnotes.append(_MARKER.sub("", citation, count=1).strip())
+            numbers[key] = len(footnotes)
+        return numbers[key]
+
+    blocks = [f"# {title}"]
+    if lead:
+        blocks.append(lead.strip())
+    for section in sections:
+        body = _section_body(section)
+        citations = section.citations or []
+        markers = [int(n) for n in _MARKER.findall(body)]
+        # as_str は 0 始まりで番号を振るが、本文は 1 始まりで書かれることが多い
+        offset = 0 if 0 in markers else 1
+
+        def renumber(match):
+            index = int(match.group(1)) - offset
+            if 0 <= index < len(citations):
+                return f"[{number_of(citations[index])}]"
+            return ""
+
+        body = _MARKER.sub(renumber, body)
+        for citation in citations:
+            number_of(citation)
+        blocks.append(f"## {section.section_title}\n\n{body}".strip())
+
+    if footnotes:
+        blocks.append(
+            "## References\n\n"
+            + "\n\n".join(f"[{i}] {note}" for i, note in enumerate(footnotes, 1))
+        )
+    return "\n\n".join(blocks)
@@ -2,9 +2,9 @@ from typing import List, Optional
 
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.pydantic_v1 import BaseModel, Field
-from langchain_openai import ChatOpenAI
 
 import conf.config as config
+from clients.registry import cached_chain, get_chat_model
 
 
 class Subsection(BaseModel):
@@ -46,7 +46,8 @@ class Outline(BaseModel):
         return f"# {self.page_title}\n\n{sections}".strip()
 
 
-def get_generate_initial_outline_chain():
+@cached_chain
+def get_generate_initial_outline_chain(cache: bool = True):
     direct_gen_outline_prompt = ChatPromptTemplate.from_messages(
         [
             (
@@ -56,7 +57,7 @@ def get_generate_initial_outline_chain():
             ("user", "{topic}"),
         ]
     )
-    llm = ChatOpenAI(model="gpt-4o-2024-05-13", temperature=0)
+    llm = get_chat_model("gpt-4o-2024-05-13", cache=cache, temperature=0)
     generate_outline_direct = direct_gen_outline_prompt | llm.with_structured_output(
         Outline
     )
@@ -2,17 +2,15 @@ import asyncio
 import sys
 from typing import List
 
-from langchain_community.retrievers import WikipediaRetriever
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.pydantic_v1 import BaseModel, Field
 from langchain_core.runnables import chain as as_runnable
-from langchain_openai import ChatOpenAI
 
 import conf.config as config
+from clients.registry import cached_chain, get_chat_model
+from retriever.wikipedia_lookup import get_wikipedia_lookup
 from .expand_topics import RelatedSubjects
 
-wikipedia_retriever = WikipediaRetriever(load_all_available_meta=True, top_k_results=1)
-
 
 class Editor(BaseModel):
     affiliation: str = Field(
@@ -51,7 +49,8 @@ def format_docs(docs):
     return "\n\n".join(format_doc(doc) for doc in docs)
 
 
-def get_gen_perspectives_chain():
+@cached_chain
+def get_gen_perspectives_chain(cache: bool = True):
     gen_perspectives_prompt = ChatPromptTemplate.from_messages(
         [
             (
@@ -66,14 +65,15 @@ def get_gen_perspectives_chain():
         ]
     )
 
-    gen_perspectives_chain = gen_perspectives_prompt | ChatOpenAI(
-        model="gpt-4o-2024-05-13"
+    gen_perspectives_chain = gen_perspectives_prompt | get_chat_model(
+        "gpt-4o-2024-05-13", cache=cache
     ).with_structured_output(Perspectives)
 
     return gen_perspectives_chain
 
 
-def get_expand_chain():
+@cached_chain
+def get_expand_chain(cache: bool = True):
     gen_related_topics_prompt = ChatPromptTemplate.from_template(
         """I'm writing a Wikipedia page for a topic mentioned below. Please identify and recommend some Wikipedia pages on closely related subjects. I'm looking for examples that provide insights into interesting aspects commonly associated with this topic, or examples that help me understand the typical content and structure included in Wikipedia pages for similar topics.
 
@@ -82,7 +82,7 @@ def get_expand_chain():
     Topic of interest: {topic}
     """
     )
-    llm = ChatOpenAI(model="gpt-4o-2024-05-13", temperature=0)
+    llm = get_chat_model("gpt-4o-2024-05-13", cache=cache, temperature=0)
     expand_chain = gen_related_topics_prompt | llm.with_structured_output(
         RelatedSubjects
     )
@@ -94,7 +94,7 @@ def get_expand_chain():
 async def survey_subjects(topic: str):
     expand_chain = get_expand_chain()
     related_subjects = await expand_chain.ainvoke({"topic": topic})
-    retrieved_docs = await wikipedia_retriever.abatch(
+    retrieved_docs = await get_wikipedia_lookup().abatch(
         related_subjects.topics, return_exceptions=True
     )
     all_docs = []
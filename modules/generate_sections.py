@@ -1,9 +1,14 @@
-from typing import List, Optional
+import asyncio
+from typing import List, Optional, Sequence, Union
 
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.pydantic_v1 import BaseModel, Field
-from langchain_openai import ChatOpenAI
 
+import conf.config as config
+from clients.registry import get_chat_model
+from retriever.chunking import merge_chunks
+
+from .context_packer import count_tokens
 from .generate_initial_outline import Subsection
 
 
@@ -40,21 +45,62 @@ class WikiSection(BaseModel):
         )
 
 
+def format_docs(docs, max_tokens: Optional[int] = None) -> str:
+    """Merge adjacent passages and keep the best ones within ``max_tokens``."""
+    formatted = []
+    used = 0
+    for doc in merge_chunks(docs):
+        text = f'<Document href="{doc.metadata["source"]}"/>\n{doc.page_content}\n</Document>'
+        if max_tokens:
+            cost = count_tokens(text)
+            if used + cost > max_tokens:
+                # 入らない文書は飛ばして、後続の短い文書で予算を埋める
+                continue
+            used += cost
+        formatted.append(text)
+    return "\n".join(formatted)
+
+
 class SectionWriter:
-    def __init__(self, vectorstore):
-        self.retriever = vectorstore.as_retriever()
+    def __init__(self, vectorstore, max_tokens: Optional[int] = None):
+        self.vectorstore = vectorstore
+        self.retriever = vectorstore.as_retriever(
+            search_kwargs={"k": config.SECTION_RETRIEVAL_K}
+        )
+        self.max_tokens = (
+            config.SECTION_CONTEXT_MAX_TOKENS if max_tokens is None else max_tokens
+        )
 
     async def retrieve(self, inputs: dict):
         docs = await self.retriever.ainvoke(inputs["topic"] + ": " + inputs["section"])
-        formatted = "\n".join(
-            [
-                f'<Document href="{doc.metadata["source"]}"/>\n{doc.page_content}\n</Document>'
-                for doc in docs
-            ]
-        )
-        return {"docs": formatted, **inputs}
+        return {"docs": format_docs(docs, self.max_tokens), **inputs}
 
-    def get_section_writer_chain(self):
+    async def retrieve_many(
+        self,
+        inputs_list: List[dict],
+        k: Union[int, Sequence[int]] = None,
+        lambda_mult: Optional[float] = None,
+    ) -> List[dict]:
+        """Retrieve references for every section with one embedding call and
+        one search over the index (see ``NumpyVectorStore.abatch_search``)."""
+        queries = [inputs["topic"] + ": " + inputs["section"] for inputs in inputs_list]
+        k = config.SECTION_RETRIEVAL_K if k is None else k
+        if hasattr(self.vectorstore, "abatch_search"):
+            docs_list = await self.vectorstore.abatch_search(
+                queries, k=k, lambda_mult=lambda_mult
+            )
+        else:
+            docs_list = await asyncio.gather(
+                *(self.retriever.ainvoke(query) for query in queries)
+            )
+        return [
+            {"docs": format_docs(docs, self.max_tokens), **inputs}
+            for docs, inputs in zip(docs_list, inputs_list)
+        ]
+
+    def get_section_writer_chain(self, cache: bool = True, retrieve: bool = True):
+        """With ``retrieve=False`` the chain expects ``docs`` in its input,
+        e.g. from ``retrieve_many``."""
         section_writer_prompt = ChatPromptTemplate.from_messages(
             [
                 (
@@ -65,10 +111,8 @@ class SectionWriter:
                 ("user", "Write the full WikiSection for the {section} section."),
             ]
         )
-        llm = ChatOpenAI(model="gpt-4o-2024-05-13", temperature=0)
-        section_writer = (
-            self.retrieve
-            | section_writer_prompt
-            | llm.with_structured_output(WikiSection)
-        )
+        llm = get_chat_model("gpt-4o-2024-05-13", cache=cache, temperature=0)
+        section_writer = section_writer_prompt | llm.with_structured_output(WikiSection)
+        if retrieve:
+            section_writer = self.retrieve | section_writer
         return section_writer
@@ -1,10 +1,20 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
 
+import conf.config as config
+from clients.registry import cached_chain, get_chat_model
+from modules.context_packer import count_tokens
 from modules.generate_initial_outline import Outline
 
+logger = logging.getLogger(__name__)
+
 
-def get_refine_outline_chain():
+@cached_chain
+def get_refine_outline_chain(cache: bool = True):
     refine_outline_prompt = ChatPromptTemplate.from_messages(
         [
             (
@@ -24,8 +34,91 @@ def get_refine_outline_chain():
         ]
     )
 
-    llm = ChatOpenAI(model="gpt-4o-2024-05-13")
+    llm = get_chat_model("gpt-4o-2024-05-13", cache=cache)
     # Using turbo preview since the context can get quite long
     refine_outline_chain = refine_outline_prompt | llm.with_structured_output(Outline)
 
     return refine_outline_chain
+
+
+@cached_chain
+def get_summarize_interview_chain(cache: bool = True):
+    summarize_prompt = ChatPromptTemplate.from_messages(
+        [
+            (
+                "system",
+                "You are a Wikipedia writer preparing the outline of a page on {topic}."
+                " Summarize what this conversation with a subject matter expert adds to the outline:"
+                " subtopics and how they relate, key facts, figures, dates, people and organisations,"
+                " and disagreements between sources. Use concise bullet points and drop small talk.",
+            ),
+            ("user", "{conversation}"),
+        ]
+    )
+    llm = get_chat_model("gpt-3.5-turbo", cache=cache, temperature=0)
+    return summarize_prompt | llm | StrOutputParser()
+
+
+class InterviewSummarizer:
+    """Map step of map-reduce outline refinement.
+
+    Once the conversations seen so far exceed ``max_tokens``, every finished
+    interview is summarized in the background, so the final refine call only
+    sees the summaries. Below the threshold nothing is summarized and the
+    outline is refined from the full conversations in one call.
+    """
+
+    def __init__(self, max_tokens: Optional[int] = None):
+        self.max_tokens = (
+            config.OUTLINE_MAP_REDUCE_TOKENS if max_tokens is None else max_tokens
+        )
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._tokens: Dict[str, int] = {}
+
+    def reset(self):
+        for task in self._tasks.values():
+            task.cancel()
+        self._tasks.clear()
+        self._tokens.clear()
+
+    @property
+    def active(self) -> bool:
+        return bool(self.max_tokens) and sum(self._tokens.values()) > self.max_tokens
+
+    def _summarize(self, topic: str, conversation: str):
+        task = self._tasks.get(conversation)
+        # 失敗したものだけやり直す
+        if task is None or (task.done() and task.exception() is not None):
+            self._tasks[conversation] = asyncio.ensure_future(
+                get_summarize_interview_chain().ainvoke(
+                    {"topic": topic, "conversation": conversation}
+                )
+            )
+
+    def add(self, topic: str, conversation: str):
+        """Register a finished interview."""
+        if not self.max_tokens:
+            return
+        if conversation not in self._tokens:
+            self._tokens[conversation] = count_tokens(conversation)
+        if self.active:
+            for seen in self._tokens:
+                self._summarize(topic, seen)
+
+    async def summaries(
+        self, topic: str, conversations: List[str]
+    ) -> Optional[List[str]]:
+        """Summaries of ``conversations`` in order, or None when they fit
+        the single-shot refine call."""
+        for conversation in conversations:
+            self.add(topic, conversation)
+        if not self.active:
+            return None
+        logger.debug(
+            "map-reduce outline refinement over %d interviews (%d tokens)",
+            len(conversations),
+            sum(self._tokens.values()),
+        )
+        return await asyncio.gather(
+            *(self._tasks[conversation] for conversation in conversations)
+        )
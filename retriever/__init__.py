@@ -1 +1,11 @@
-from .sklearn_vector_store import get_sklearn_vector_store
\ No newline at end of file
+from .chunking import chunk_reference, merge_chunks
+from .numpy_vector_store import NumpyVectorStore
+from .reference_dedup import (
+    ReferenceDeduplicator,
+    canonicalize_references,
+    canonicalize_url,
+    merge_references,
+    strip_tracking_params,
+)
+from .reference_indexer import ReferenceIndexer
+from .sklearn_vector_store import get_sklearn_vector_store
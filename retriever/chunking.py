@@ -0,0 +1,100 @@
+import re
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+import conf.config as config
+
+# 和文の句点の後には空白がないので、句点の直後も区切りとして扱う
+_BOUNDARY = re.compile(r"(?<=[.!?])\s+|(?<=[。！？])|\n+")
+
+
+def chunk_spans(text: str, size: int, overlap: int = 0) -> List[Tuple[int, int]]:
+    """``(start, end)`` character offsets of chunks of at most ``size``
+    characters that overlap by about ``overlap``.
+
+    Chunks end at a sentence or line break in their last third when there is
+    one, otherwise at whitespace.
+    """
+    if size <= 0 or len(text) <= size:
+        return [(0, len(text))] if text.strip() else []
+    overlap = min(max(0, overlap), size // 2)
+    spans = []
+    start = 0
+    while start < len(text):
+        end = min(len(text), start + size)
+        if end < len(text):
+            window = text[start + 2 * size // 3 : end]
+            breaks = [m.end() for m in _BOUNDARY.finditer(window)]
+            if breaks:
+                end = start + 2 * size // 3 + breaks[-1]
+            else:
+                space = text.rfind(" ", start + size // 2, end)
+                if space > 0:
+                    end = space + 1
+        if text[start:end].strip():
+            spans.append((start, end))
+        if end >= len(text):
+            break
+        next_start = max(start + 1, end - overlap)
+        # 単語の途中から始めない
+        space = text.find(" ", next_start, end)
+        start = space + 1 if overlap and space > 0 else next_start
+    return spans
+
+
+def chunk_reference(
+    url: str, content: str, size: int = None, overlap: int = None
+) -> List[Document]:
+    """Split a reference into passages with ``source``/``start``/``end``
+    metadata. ``size=0`` keeps the reference whole."""
+    size = config.REFERENCE_CHUNK_SIZE if size is None else size
+    overlap = config.REFERENCE_CHUNK_OVERLAP if overlap is None else overlap
+    return [
+        Document(
+            page_content=content[start:end],
+            metadata={"source": url, "start": start, "end": end},
+        )
+        for start, end in chunk_spans(content or "", size, overlap)
+    ]
+
+
+def merge_chunks(docs: List[Document]) -> List[Document]:
+    """Merge hits from the same source that overlap or touch into one passage.
+
+    The merged passages are ordered by the rank of their best hit. Documents
+    without offsets are passed through.
+    """
+    spans: Dict[Optional[str], list] = {}
+    merged = []
+    for rank, doc in enumerate(docs):
+        start = doc.metadata.get("start")
+        if start is None:
+            merged.append((rank, doc))
+            continue
+        spans.setdefault(doc.metadata.get("source"), []).append(
+            [start, doc.metadata["end"], doc.page_content, rank]
+        )
+    for source, hits in spans.items():
+        hits.sort()
+        current = hits[0]
+        for hit in hits[1:]:
+            start, end, text, rank = hit
+            if start <= current[1]:
+                if end > current[1]:
+                    current[2] += text[current[1] - start :]
+                    current[1] = end
+                current[3] = min(current[3], rank)
+            else:
+                merged.append((current[3], _passage(source, current)))
+                current = hit
+        merged.append((current[3], _passage(source, current)))
+    merged.sort(key=lambda item: item[0])
+    return [doc for _, doc in merged]
+
+
+def _passage(source, span) -> Document:
+    start, end, text, _ = span
+    return Document(
+        page_content=text, metadata={"source": source, "start": start, "end": end}
+    )
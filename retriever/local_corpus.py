@@ -0,0 +1,394 @@
+"""BM25 search over a local document collection.
+
+    python -m retriever.local_corpus index docs/
+    python -m retriever.local_corpus search "query"
+
+Files are split into passages and kept in an inverted index persisted in
+SQLite. Re-indexing a directory only reads files whose size or mtime changed,
+and drops the passages of files that were removed.
+"""
+
+import argparse
+import math
+import os
+import re
+import sqlite3
+import threading
+from array import array
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+import conf.config as config
+
+DEFAULT_EXTENSIONS = (".txt", ".md", ".markdown", ".rst", ".html", ".htm")
+
+_WORD = re.compile(r"[^\W\d_]+|\d+", re.UNICODE)
+# 日本語・中国語は分かち書きされないので文字 bigram にする
+_CJK = re.compile(r"[぀-ヿ㐀-䶿一-鿿豈-﫿]+")
+_TAG = re.compile(r"<(script|style)\b.*?</\1>|<[^>]+>", re.DOTALL | re.IGNORECASE)
+
+
+def tokenize(text: str) -> List[str]:
+    terms = []
+    for word in _WORD.findall(text.casefold()):
+        if word.isascii():
+            terms.append(word)
+            continue
+        for run in _CJK.split(word):
+            if run:
+                terms.append(run)
+        for run in _CJK.findall(word):
+            if len(run) == 1:
+                terms.append(run)
+            else:
+                terms.extend(run[i : i + 2] for i in range(len(run) - 1))
+    return terms
+
+
+def split_passages(text: str, passage_words: int) -> List[str]:
+    """Group paragraphs into passages of roughly ``passage_words`` words."""
+    passages, current, size = [], [], 0
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        words = len(paragraph.split())
+        if current and size + words > passage_words:
+            passages.append("\n\n".join(current))
+            current, size = [], 0
+        current.append(paragraph)
+        size += words
+    if current:
+        passages.append("\n\n".join(current))
+    return passages
+
+
+def read_document(path: Path) -> str:
+    text = path.read_text(encoding="utf-8", errors="replace")
+    if path.suffix.lower() in (".html", ".htm"):
+        text = _TAG.sub(" ", text)
+    return text
+
+
+class LocalCorpusIndex:
+    """Persistent BM25 inverted index.
+
+    Postings (document ids and term frequencies per term) are held in memory
+    as compact arrays and written back to SQLite for the terms an update
+    touched. Removed passages are tombstoned and their postings are pruned by
+    ``compact``, which runs on commit once tombstones make up a quarter of the
+    passages in the postings. Ids are never reused.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        k1: float = 1.5,
+        b: float = 0.75,
+        passage_words: int = None,
+    ):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.passage_words = passage_words or config.LOCAL_CORPUS_PASSAGE_WORDS
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                "id INTEGER PRIMARY KEY, url TEXT UNIQUE NOT NULL, "
+                "source TEXT, length INTEGER NOT NULL, content TEXT NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS documents_source ON documents (source)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sources ("
+                "path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS postings ("
+                "term TEXT PRIMARY KEY, doc_ids BLOB NOT NULL, tfs BLOB NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS meta ("
+                "key TEXT PRIMARY KEY, value INTEGER NOT NULL)"
+            )
+        self._load()
+
+    def _load(self):
+        self._postings: Dict[str, Tuple[array, array]] = {}
+        for term, doc_ids, tfs in self._conn.execute(
+            "SELECT term, doc_ids, tfs FROM postings"
+        ):
+            ids, counts = array("I"), array("I")
+            ids.frombytes(doc_ids)
+            counts.frombytes(tfs)
+            self._postings[term] = (ids, counts)
+        rows = self._conn.execute("SELECT id, length FROM documents").fetchall()
+        meta = dict(self._conn.execute("SELECT key, value FROM meta"))
+        # 削除済みの id が postings に残っているので、使ったことのある id は再利用しない
+        next_id = max(
+            meta.get("next_id", 1),
+            max((doc_id for doc_id, _ in rows), default=0) + 1,
+            max((max(ids) for ids, _ in self._postings.values() if ids), default=0) + 1,
+        )
+        self._lengths = np.zeros(max(1024, next_id), dtype=np.float32)
+        self._alive = np.zeros(len(self._lengths), dtype=bool)
+        for doc_id, length in rows:
+            self._lengths[doc_id] = length
+            self._alive[doc_id] = True
+        self._next_id = next_id
+        self._total_length = float(self._lengths[self._alive].sum())
+        # compact 以降に削除されたパッセージ数
+        self._tombstones = meta.get("tombstones", 0)
+        self._dirty = set()
+
+    def __len__(self) -> int:
+        return int(self._alive[: self._next_id].sum())
+
+    def _reserve(self, size: int):
+        if size <= len(self._lengths):
+            return
+        capacity = max(size, 2 * len(self._lengths))
+        lengths = np.zeros(capacity, dtype=np.float32)
+        lengths[: len(self._lengths)] = self._lengths
+        alive = np.zeros(capacity, dtype=bool)
+        alive[: len(self._alive)] = self._alive
+        self._lengths, self._alive = lengths, alive
+
+    def add_documents(self, documents: Iterable[Tuple[str, str]], source=None):
+        """Index ``(url, content)`` pairs, replacing passages with the same url
+        (within the batch the last one wins). Searchable at once; persisted on
+        ``commit``."""
+        # 同じバッチ内の重複 URL は DB に入る前なので _remove_where では消えない
+        documents = dict(documents)
+        with self._lock:
+            rows = []
+            for url, content in documents.items():
+                self._remove_where("url = ?", (url,))
+                terms = tokenize(content)
+                doc_id = self._next_id
+                self._next_id += 1
+                self._reserve(self._next_id)
+                counts = Counter(terms)
+                for term, tf in counts.items():
+                    postings = self._postings.get(term)
+                    if postings is None:
+                        postings = self._postings[term] = (array("I"), array("I"))
+                    postings[0].append(doc_id)
+                    postings[1].append(tf)
+                self._dirty.update(counts)
+                self._lengths[doc_id] = len(terms)
+                self._alive[doc_id] = True
+                self._total_length += len(terms)
+                rows.append((doc_id, url, source, len(terms), content))
+            self._conn.executemany(
+                "INSERT INTO documents (id, url, source, length, content)"
+                " VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+        return len(rows)
+
+    def _remove_where(self, where: str, params) -> int:
+        ids = [
+            doc_id
+            for (doc_id,) in self._conn.execute(
+                f"SELECT id FROM documents WHERE {where}", params
+            )
+        ]
+        if ids:
+            self._alive[ids] = False
+            self._tombstones += len(ids)
+            self._total_length -= float(self._lengths[ids].sum())
+            self._conn.execute(f"DELETE FROM documents WHERE {where}", params)
+        return len(ids)
+
+    def remove_source(self, source: str) -> int:
+        with self._lock:
+            self._conn.execute("DELETE FROM sources WHERE path = ?", (source,))
+            return self._remove_where("source = ?", (source,))
+
+    def update_from_directory(
+        self, directory: str, extensions: Iterable[str] = DEFAULT_EXTENSIONS
+    ) -> dict:
+        """Bring the index in line with the files under ``directory``."""
+        extensions = tuple(e.lower() for e in extensions)
+        stats = {"added": 0, "updated": 0, "removed": 0, "unchanged": 0}
+        with self._lock:
+            known = {
+                path: (size, mtime)
+                for path, size, mtime in self._conn.execute(
+                    "SELECT path, size, mtime FROM sources"
+                )
+            }
+            seen = set()
+            for path in sorted(Path(directory).rglob("*")):
+                if not path.is_file() or path.suffix.lower() not in extensions:
+                    continue
+                source = str(path.resolve())
+                seen.add(source)
+                stat = path.stat()
+                signature = (stat.st_size, stat.st_mtime)
+                if known.get(source) == signature:
+                    stats["unchanged"] += 1
+                    continue
+                stats["updated" if source in known else "added"] += 1
+                self._remove_where("source = ?", (source,))
+                uri = path.resolve().as_uri()
+                passages = split_passages(read_document(path), self.passage_words)
+                self.add_documents(
+                    (
+                        (uri if len(passages) == 1 else f"{uri}#p{i}", passage)
+                        for i, passage in enumerate(passages)
+                    ),
+                    source=source,
+                )
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO sources VALUES (?, ?, ?)",
+                    (source, *signature),
+                )
+            for source in known.keys() - seen:
+                self.remove_source(source)
+                stats["removed"] += 1
+            self.commit()
+        return stats
+
+    def commit(self):
+        """Write postings touched since the last commit."""
+        with self._lock:
+            if (
+                self._tombstones
+                and self._tombstones * 4 >= len(self) + self._tombstones
+            ):
+                self.compact()
+            updated, deleted = [], []
+            for term in self._dirty:
+                postings = self._postings.get(term)
+                if postings is None:
+                    deleted.append((term,))
+                else:
+                    updated.append((term, postings[0].tobytes(), postings[1].tobytes()))
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO postings VALUES (?, ?, ?)", updated
+                )
+                self._conn.executemany("DELETE FROM postings WHERE term = ?", deleted)
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                    [("next_id", self._next_id), ("tombstones", self._tombstones)],
+                )
+            self._dirty.clear()
+
+    def compact(self):
+        """Drop postings of removed passages."""
+        with self._lock:
+            for term, (ids, counts) in list(self._postings.items()):
+                doc_ids = np.frombuffer(ids, dtype=np.uint32)
+                keep = self._alive[doc_ids]
+                if keep.all():
+                    continue
+                self._dirty.add(term)
+                if not keep.any():
+                    del self._postings[term]
+                    continue
+                kept_ids = array("I", doc_ids[keep].tobytes())
+                kept_counts = array(
+                    "I", np.frombuffer(counts, dtype=np.uint32)[keep].tobytes()
+                )
+                del doc_ids
+                self._postings[term] = (kept_ids, kept_counts)
+            self._tombstones = 0
+
+    def search(self, query: str, k: int = 10) -> List[dict]:
+        """Top ``k`` passages by BM25 as ``{"content", "url"}``."""
+        if k <= 0:
+            return []
+        with self._lock:
+            n_docs = len(self)
+            if not n_docs:
+                return []
+            avg_length = self._total_length / n_docs
+            lengths = self._lengths[: self._next_id]
+            scores = np.zeros(self._next_id, dtype=np.float32)
+            for term in set(tokenize(query)):
+                postings = self._postings.get(term)
+                if postings is None:
+                    continue
+                ids = np.frombuffer(postings[0], dtype=np.uint32)
+                tfs = np.frombuffer(postings[1], dtype=np.uint32).astype(np.float32)
+                df = len(ids)
+                idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+                norm = self.k1 * (1 - self.b + self.b * lengths[ids] / avg_length)
+                scores[ids] += idf * tfs * (self.k1 + 1) / (tfs + norm)
+                del ids
+            scores[~self._alive[: self._next_id]] = 0
+            k = min(k, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = [int(i) for i in top[np.argsort(-scores[top])] if scores[i] > 0]
+            if not top:
+                return []
+            rows = dict(
+                (doc_id, (url, content))
+                for doc_id, url, content in self._conn.execute(
+                    "SELECT id, url, content FROM documents WHERE id IN (%s)"
+                    % ",".join("?" * len(top)),
+                    top,
+                )
+            )
+        return [{"content": rows[i][1], "url": rows[i][0]} for i in top if i in rows]
+
+    def close(self):
+        with self._lock:
+            self.commit()
+            self._conn.close()
+
+
+_corpus: Optional[LocalCorpusIndex] = None
+_corpus_lock = threading.Lock()
+
+
+def get_local_corpus() -> LocalCorpusIndex:
+    """Open the configured index, bringing it up to date with
+    ``LOCAL_CORPUS_DIR`` on first use."""
+    global _corpus
+    with _corpus_lock:
+        if _corpus is None:
+            index = LocalCorpusIndex(config.LOCAL_CORPUS_INDEX_PATH)
+            if config.LOCAL_CORPUS_DIR:
+                index.update_from_directory(config.LOCAL_CORPUS_DIR)
+            _corpus = index
+        return _corpus
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--index", default=config.LOCAL_CORPUS_INDEX_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+    index_parser = commands.add_parser("index", help="index or re-index a directory")
+    index_parser.add_argument("directory")
+    index_parser.add_argument("--extensions", nargs="+", default=DEFAULT_EXTENSIONS)
+    search_parser = commands.add_parser("search")
+    search_parser.add_argument("query")
+    search_parser.add_argument("-k", type=int, default=config.LOCAL_CORPUS_RESULTS)
+    args = parser.parse_args(argv)
+
+    index = LocalCorpusIndex(args.index)
+    if args.command == "index":
+        stats = index.update_from_directory(args.directory, args.extensions)
+        print(f"{stats} passages={len(index)}")
+    else:
+        for result in index.search(args.query, args.k):
+            print(result["url"])
+            print("    " + result["content"][:200].replace("\n", " "))
+    index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,366 @@
+import uuid
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    if k <= 0 or scores.size == 0:
+        return np.empty(0, dtype=np.int64)
+    if k < scores.size:
+        idx = np.argpartition(-scores, k - 1)[:k]
+    else:
+        idx = np.arange(scores.size)
+    return idx[np.argsort(-scores[idx], kind="stable")]
+
+
+def _mmr(
+    query: np.ndarray,
+    candidates: np.ndarray,
+    k: int,
+    lambda_mult: float,
+) -> List[int]:
+    """Maximal marginal relevance over already normalized candidate rows."""
+    relevance = candidates @ query
+    pairwise = candidates @ candidates.T
+    selected = [int(np.argmax(relevance))]
+    # 選択済みとの最大類似度を逐次更新する
+    max_sim = pairwise[selected[0]].copy()
+    while len(selected) < min(k, len(candidates)):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * max_sim
+        scores[selected] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        np.maximum(max_sim, pairwise[best], out=max_sim)
+    return selected
+
+
+class NumpyVectorStore(VectorStore):
+    """In-process exact vector index on a contiguous float32 matrix.
+
+    Rows are L2-normalized on insert, so cosine similarity is a single
+    matrix-vector product. ``filter`` matches metadata by equality, or by
+    membership when a list/set is given (e.g. ``{"source": [url1, url2]}``).
+    Adding an id that is already stored replaces that row.
+    """
+
+    def __init__(self, embedding: Embeddings, initial_capacity: int = 1024) -> None:
+        self._embedding = embedding
+        self._initial_capacity = initial_capacity
+        self.clear()
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+    def __len__(self) -> int:
+        return self._size
+
+    def clear(self) -> None:
+        """Drop every stored vector and document (start of a new run)."""
+        self._matrix: Optional[np.ndarray] = None
+        self._size = 0
+        self._ids: List[str] = []
+        self._texts: List[str] = []
+        self._metadatas: List[dict] = []
+        self._source_rows: Dict[Any, List[int]] = {}
+        self._id_rows: Dict[str, int] = {}
+
+    @property
+    def vectors(self) -> np.ndarray:
+        if self._matrix is None:
+            return np.empty((0, 0), dtype=np.float32)
+        return self._matrix[: self._size]
+
+    def _reserve(self, extra: int, dim: int) -> None:
+        if self._matrix is None:
+            capacity = max(self._initial_capacity, extra)
+            self._matrix = np.empty((capacity, dim), dtype=np.float32)
+            return
+        if self._matrix.shape[1] != dim:
+            raise ValueError(
+                f"Embedding dimension {dim} does not match index dimension {self._matrix.shape[1]}"
+            )
+        needed = self._size + extra
+        if needed > self._matrix.shape[0]:
+            capacity = max(needed, self._matrix.shape[0] * 2)
+            grown = np.empty((capacity, dim), dtype=np.float32)
+            grown[: self._size] = self._matrix[: self._size]
+            self._matrix = grown
+
+    def add_vectors(
+        self,
+        vectors,
+        texts: List[str],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+    ) -> List[str]:
+        if not texts:
+            return []
+        vectors = _normalize(
+            np.asarray(vectors, dtype=np.float32).reshape(len(texts), -1)
+        )
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+        # バッチ内で同じ id が重なったら最後のものを使う
+        last = {id_: i for i, id_ in enumerate(ids)}
+        new = [i for i, id_ in enumerate(ids) if last[id_] == i]
+        replaced = [i for i in new if ids[i] in self._id_rows]
+        for i in replaced:
+            row = self._id_rows[ids[i]]
+            self._matrix[row] = vectors[i]
+            self._texts[row] = texts[i]
+            self._source_rows[self._metadatas[row].get("source")].remove(row)
+            self._metadatas[row] = metadatas[i]
+            self._source_rows.setdefault(metadatas[i].get("source"), []).append(row)
+        new = [i for i in new if ids[i] not in self._id_rows]
+        self._reserve(len(new), vectors.shape[1])
+        start = self._size
+        self._matrix[start : start + len(new)] = vectors[new]
+        for row, i in enumerate(new, start):
+            self._texts.append(texts[i])
+            self._metadatas.append(metadatas[i])
+            self._ids.append(ids[i])
+            self._id_rows[ids[i]] = row
+            self._source_rows.setdefault(metadatas[i].get("source"), []).append(row)
+        self._size += len(new)
+        return ids
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        texts = list(texts)
+        if not texts:
+            return []
+        vectors = self._embedding.embed_documents(texts)
+        return self.add_vectors(vectors, texts, metadatas, ids)
+
+    async def aadd_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        texts = list(texts)
+        if not texts:
+            return []
+        vectors = await self._embedding.aembed_documents(texts)
+        return self.add_vectors(vectors, texts, metadatas, ids)
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        if ids is None:
+            self.clear()
+            return True
+        drop = set(ids)
+        keep = [i for i, id_ in enumerate(self._ids) if id_ not in drop]
+        vectors = self.vectors[keep].copy()
+        texts = [self._texts[i] for i in keep]
+        metadatas = [self._metadatas[i] for i in keep]
+        kept_ids = [self._ids[i] for i in keep]
+        self.clear()
+        self.add_vectors(vectors, texts, metadatas, kept_ids)
+        return True
+
+    def _filter_rows(self, filter: Optional[dict]) -> Optional[np.ndarray]:
+        if not filter:
+            return None
+        rows = None
+        for key, expected in filter.items():
+            values = (
+                expected if isinstance(expected, (list, set, tuple)) else [expected]
+            )
+            if key == "source":
+                matched = {
+                    row for value in values for row in self._source_rows.get(value, [])
+                }
+            else:
+                values = set(values)
+                matched = {
+                    row
+                    for row, metadata in enumerate(self._metadatas)
+                    if metadata.get(key) in values
+                }
+            rows = matched if rows is None else rows & matched
+        return np.fromiter(sorted(rows), dtype=np.int64)
+
+    def _document(self, row: int) -> Document:
+        return Document(
+            page_content=self._texts[row], metadata=dict(self._metadatas[row])
+        )
+
+    def _search_rows(
+        self, query: np.ndarray, k: int, filter: Optional[dict]
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        rows = self._filter_rows(filter)
+        matrix = self.vectors if rows is None else self.vectors[rows]
+        if matrix.size == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        scores = matrix @ query
+        best = _top_k(scores, k)
+        return (best if rows is None else rows[best]), scores[best]
+
+    def similarity_search_by_vector_with_score(
+        self, embedding: List[float], k: int = 4, filter: Optional[dict] = None
+    ) -> List[Tuple[Document, float]]:
+        query = _normalize(np.asarray(embedding, dtype=np.float32))
+        rows, scores = self._search_rows(query, k, filter)
+        return [(self._document(row), float(s)) for row, s in zip(rows, scores)]
+
+    def similarity_search_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        filter: Optional[dict] = None,
+        **kwargs: Any,
+    ) -> List[Document]:
+        return [
+            doc
+            for doc, _ in self.similarity_search_by_vector_with_score(
+                embedding, k=k, filter=filter
+            )
+        ]
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, filter: Optional[dict] = None, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        embedding = self._embedding.embed_query(query)
+        return self.similarity_search_by_vector_with_score(embedding, k, filter)
+
+    def similarity_search(
+        self, query: str, k: int = 4, filter: Optional[dict] = None, **kwargs: Any
+    ) -> List[Document]:
+        embedding = self._embedding.embed_query(query)
+        return self.similarity_search_by_vector(embedding, k=k, filter=filter)
+
+    async def asimilarity_search(
+        self, query: str, k: int = 4, filter: Optional[dict] = None, **kwargs: Any
+    ) -> List[Document]:
+        embedding = await self._embedding.aembed_query(query)
+        return self.similarity_search_by_vector(embedding, k=k, filter=filter)
+
+    def batch_search_by_vectors(
+        self,
+        embeddings: List[List[float]],
+        k: Union[int, Sequence[int]] = 4,
+        fetch_k: int = 20,
+        lambda_mult: Optional[float] = None,
+        filter: Optional[dict] = None,
+    ) -> List[List[Document]]:
+        """Search many queries with one matrix multiply.
+
+        ``k`` may be given per query. With ``lambda_mult`` set, each query's
+        top ``fetch_k`` rows are re-ranked by maximal marginal relevance.
+        """
+        ks = [k] * len(embeddings) if isinstance(k, int) else list(k)
+        if len(ks) != len(embeddings):
+            raise ValueError("k must be an int or have one entry per query")
+        if not embeddings:
+            return []
+        rows = self._filter_rows(filter)
+        matrix = self.vectors if rows is None else self.vectors[rows]
+        if matrix.size == 0:
+            return [[] for _ in embeddings]
+        queries = _normalize(np.asarray(embeddings, dtype=np.float32))
+        scores = queries @ matrix.T
+        results = []
+        for query, query_scores, query_k in zip(queries, scores, ks):
+            if lambda_mult is None or query_k <= 0:
+                best = _top_k(query_scores, query_k)
+            else:
+                candidates = _top_k(query_scores, max(query_k, fetch_k))
+                chosen = _mmr(query, matrix[candidates], query_k, lambda_mult)
+                best = candidates[chosen]
+            if rows is not None:
+                best = rows[best]
+            results.append([self._document(int(row)) for row in best])
+        return results
+
+    async def abatch_search(
+        self,
+        queries: List[str],
+        k: Union[int, Sequence[int]] = 4,
+        fetch_k: int = 20,
+        lambda_mult: Optional[float] = None,
+        filter: Optional[dict] = None,
+    ) -> List[List[Document]]:
+        # 全クエリを1回の埋め込み呼び出しで済ませる
+        embeddings = await self._embedding.aembed_documents(queries) if queries else []
+        return self.batch_search_by_vectors(embeddings, k, fetch_k, lambda_mult, filter)
+
+    def _select_relevance_score_fn(self) -> Callable[[float], float]:
+        # Scores are already cosine similarities.
+        return lambda score: score
+
+    def max_marginal_relevance_search_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        fetch_k: int = 20,
+        lambda_mult: float = 0.5,
+        filter: Optional[dict] = None,
+        **kwargs: Any,
+    ) -> List[Document]:
+        if k <= 0:
+            return []
+        query = _normalize(np.asarray(embedding, dtype=np.float32))
+        rows, _ = self._search_rows(query, max(k, fetch_k), filter)
+        if rows.size == 0:
+            return []
+        chosen = _mmr(query, self.vectors[rows], k, lambda_mult)
+        return [self._document(int(rows[i])) for i in chosen]
+
+    def max_marginal_relevance_search(
+        self,
+        query: str,
+        k: int = 4,
+        fetch_k: int = 20,
+        lambda_mult: float = 0.5,
+        filter: Optional[dict] = None,
+        **kwargs: Any,
+    ) -> List[Document]:
+        embedding = self._embedding.embed_query(query)
+        return self.max_marginal_relevance_search_by_vector(
+            embedding, k, fetch_k, lambda_mult, filter
+        )
+
+    async def amax_marginal_relevance_search(
+        self,
+        query: str,
+        k: int = 4,
+        fetch_k: int = 20,
+        lambda_mult: float = 0.5,
+        filter: Optional[dict] = None,
+        **kwargs: Any,
+    ) -> List[Document]:
+        embedding = await self._embedding.aembed_query(query)
+        return self.max_marginal_relevance_search_by_vector(
+            embedding, k, fetch_k, lambda_mult, filter
+        )
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> "NumpyVectorStore":
+        store = cls(embedding=embedding, **kwargs)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
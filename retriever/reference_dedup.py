@@ -0,0 +1,269 @@
+import hashlib
+import re
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import parse_qsl, unquote_plus, urlencode, urlsplit, urlunsplit
+
+import numpy as np
+
+import conf.config as config
+
+# クエリから落とすトラッキング用パラメータ
+TRACKING_PARAMS = {
+    "fbclid",
+    "gclid",
+    "dclid",
+    "msclkid",
+    "yclid",
+    "igshid",
+    "mc_cid",
+    "mc_eid",
+    "ref",
+    "ref_src",
+    "ref_url",
+    "referrer",
+    "spm",
+    "_ga",
+    "_gl",
+    "_hsenc",
+    "_hsmi",
+    "ncid",
+    "cmpid",
+}
+TRACKING_PREFIXES = ("utm_", "pk_", "mtm_", "hsa_")
+# モバイル版・AMP 版のホスト
+MOBILE_HOST_PREFIXES = ("www.", "m.", "mobile.", "amp.")
+# "<言語>.m.<サイト>" 形式のモバイル版を持つサイト
+MOBILE_LABEL_SITES = (
+    "wikipedia.org",
+    "wiktionary.org",
+    "wikibooks.org",
+    "wikiquote.org",
+    "wikisource.org",
+    "wikinews.org",
+    "wikiversity.org",
+    "wikivoyage.org",
+    "wikimedia.org",
+    "wikidata.org",
+    "mediawiki.org",
+)
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+def _is_tracking_param(key: str) -> bool:
+    key = key.lower()
+    return key in TRACKING_PARAMS or key.startswith(TRACKING_PREFIXES)
+
+
+def strip_tracking_params(url: str) -> str:
+    """The URL as given, minus tracking query parameters. This is the form
+    that is stored and cited."""
+    url = url.strip()
+    try:
+        parts = urlsplit(url)
+    except ValueError:
+        return url
+    if not parts.query:
+        return url
+    # 残すパラメータはエンコードも順序も元のまま
+    query = "&".join(
+        pair
+        for pair in parts.query.split("&")
+        if pair and not _is_tracking_param(unquote_plus(pair.split("=", 1)[0]))
+    )
+    return urlunsplit(parts._replace(query=query))
+
+
+def canonicalize_url(url: str) -> str:
+    """Normalize a URL so the same page reached through tracking parameters,
+    mobile/AMP hosts, default ports or a trailing slash maps to one key.
+
+    Only for comparing URLs: the result is not guaranteed to resolve.
+    """
+    try:
+        parts = urlsplit(url.strip())
+    except ValueError:
+        return url.strip()
+    if not parts.netloc:
+        return url.strip()
+
+    scheme = (parts.scheme or "https").lower()
+    host = (parts.hostname or "").lower().rstrip(".")
+    for prefix in MOBILE_HOST_PREFIXES:
+        if host.startswith(prefix) and host.count(".") > 1:
+            host = host[len(prefix) :]
+            break
+    # en.m.wikipedia.org のような中間の "m."
+    if host.endswith(MOBILE_LABEL_SITES):
+        host = host.replace(".m.", ".", 1)
+    port = parts.port if parts.port not in (None, 80, 443) else None
+    netloc = f"{host}:{port}" if port else host
+
+    path = re.sub(r"/{2,}", "/", parts.path or "/")
+    if len(path) > 1:
+        path = path.rstrip("/")
+    if path.endswith("/amp"):
+        path = path[: -len("/amp")] or "/"
+
+    query = sorted(
+        (key, value)
+        for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not _is_tracking_param(key)
+    )
+    return urlunsplit((scheme, netloc, path, urlencode(query), ""))
+
+
+def _url_key(url: str) -> str:
+    # http と https は同じページとして扱う
+    return canonicalize_url(url).split("://", 1)[-1]
+
+
+def merge_references(references: Optional[dict], new_references: Optional[dict]):
+    """Add ``new_references`` to ``references`` (in place), skipping pages
+    already present under another URL form. Keys are the URLs without
+    tracking parameters; the first content seen wins."""
+    references = {} if references is None else references
+    keys = {_url_key(url) for url in references}
+    for url, content in (new_references or {}).items():
+        key = _url_key(url)
+        if key not in keys:
+            keys.add(key)
+            references[strip_tracking_params(url)] = content
+    return references
+
+
+def canonicalize_references(references: Optional[dict]) -> dict:
+    """References with one entry per page (see ``merge_references``)."""
+    return merge_references({}, references)
+
+
+class MinHasher:
+    """MinHash signatures over word shingles."""
+
+    def __init__(self, num_perm: int = 64, shingle_size: int = 5, seed: int = 1):
+        rng = np.random.RandomState(seed)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self._a = rng.randint(1, 1 << 61, size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, 1 << 61, size=num_perm, dtype=np.uint64)
+
+    def shingles(self, text: str) -> set:
+        terms = _WORD.findall(text.casefold())
+        size = self.shingle_size
+        if len(terms) < size:
+            return {" ".join(terms)} if terms else set()
+        return {" ".join(terms[i : i + size]) for i in range(len(terms) - size + 1)}
+
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        shingles = self.shingles(text)
+        if not shingles:
+            return None
+        hashes = np.array(
+            [
+                int.from_bytes(
+                    hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little"
+                )
+                for s in shingles
+            ],
+            dtype=np.uint64,
+        )
+        # 乗算のオーバーフローは 2^64 で折り返す（datasketch と同じ）
+        with np.errstate(over="ignore"):
+            permuted = (np.outer(hashes, self._a) + self._b) % _MERSENNE_PRIME
+        return np.bitwise_and(permuted, _MAX_HASH).min(axis=0)
+
+
+class ReferenceDeduplicator:
+    """Incrementally filters references down to page- and content-unique ones.
+
+    URLs are compared after ``canonicalize_url`` but kept as given, minus
+    tracking parameters, so citations still resolve. Contents are compared by
+    MinHash with LSH banding, and a reference whose estimated Jaccard
+    similarity to an already accepted one reaches ``threshold`` is dropped
+    (mirrors, syndicated copies, print views).
+    """
+
+    def __init__(
+        self,
+        threshold: float = None,
+        num_perm: int = 64,
+        bands: int = 16,
+        shingle_size: int = 5,
+    ):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = (
+            config.REFERENCE_DEDUP_THRESHOLD if threshold is None else threshold
+        )
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.hasher = MinHasher(num_perm, shingle_size)
+        self.reset()
+
+    def reset(self):
+        self._urls: Dict[str, str] = {}
+        self._signatures: Dict[str, np.ndarray] = {}
+        self._buckets = defaultdict(set)
+        self.url_duplicates = 0
+        self.near_duplicates = 0
+
+    def __len__(self) -> int:
+        return len(self._urls)
+
+    def _band_keys(self, signature: np.ndarray) -> List[tuple]:
+        return [
+            (i, signature[i * self.rows : (i + 1) * self.rows].tobytes())
+            for i in range(self.bands)
+        ]
+
+    def _near_duplicate_of(self, signature: np.ndarray) -> Optional[str]:
+        candidates = set()
+        for key in self._band_keys(signature):
+            candidates.update(self._buckets.get(key, ()))
+        for url in candidates:
+            if np.mean(self._signatures[url] == signature) >= self.threshold:
+                return url
+        return None
+
+    def add(self, references: Optional[dict]) -> dict:
+        """Return the references not seen before, keyed by URL without
+        tracking parameters."""
+        accepted = {}
+        for url, content in (references or {}).items():
+            cleaned = strip_tracking_params(url)
+            key = _url_key(url)
+            if key in self._urls:
+                self.url_duplicates += 1
+                continue
+            signature = self.hasher.signature(content or "")
+            if signature is not None and self._near_duplicate_of(signature):
+                self.near_duplicates += 1
+                continue
+            self._urls[key] = cleaned
+            if signature is not None:
+                self._signatures[key] = signature
+                for band_key in self._band_keys(signature):
+                    self._buckets[band_key].add(key)
+            accepted[cleaned] = content
+        return accepted
+
+    def discard(self, urls: Iterable[str]):
+        """Forget references so they can be added again (e.g. after a failed
+        embedding call)."""
+        for url in urls:
+            key = _url_key(url)
+            self._urls.pop(key, None)
+            signature = self._signatures.pop(key, None)
+            if signature is not None:
+                for band_key in self._band_keys(signature):
+                    self._buckets[band_key].discard(key)
+
+    def stats(self) -> dict:
+        return {
+            "unique": len(self._urls),
+            "url_duplicates": self.url_duplicates,
+            "near_duplicates": self.near_duplicates,
+        }
@@ -0,0 +1,75 @@
+import asyncio
+import logging
+
+from .chunking import chunk_reference
+from .reference_dedup import ReferenceDeduplicator
+
+logger = logging.getLogger(__name__)
+
+
+class ReferenceIndexer:
+    """Pushes cited references into a vector store while interviews are
+    still running, so ``index_references`` only has to wait for the tail.
+
+    References are canonicalized and near-duplicates dropped before they are
+    split into passages (see ``chunk_reference``) and embedded.
+    """
+
+    def __init__(self, vectorstore, deduplicator=None):
+        self.vectorstore = vectorstore
+        self.deduplicator = deduplicator or ReferenceDeduplicator()
+        self._tasks = set()
+        self._errors = []
+
+    def reset(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks.clear()
+        self._errors.clear()
+        self.deduplicator.reset()
+        self.vectorstore.clear()
+
+    def submit(self, references: dict):
+        new = self.deduplicator.add(references)
+        if not new:
+            return
+        docs = [
+            doc for url, content in new.items() for doc in chunk_reference(url, content)
+        ]
+        if not docs:
+            return
+        task = asyncio.ensure_future(self._add(docs))
+        self._tasks.add(task)
+        task.add_done_callback(self._finished)
+
+    def _finished(self, task):
+        self._tasks.discard(task)
+        if task.cancelled():
+            return
+        # drain() より前に終わったタスクの例外も取り出して残しておく
+        error = task.exception()
+        if error is not None:
+            logger.warning("indexing references failed: %r", error, exc_info=error)
+            self._errors.append(error)
+
+    async def _add(self, docs):
+        try:
+            await self.vectorstore.aadd_documents(docs)
+        except Exception:
+            # 失敗した分は再投入できるように未登録へ戻す
+            self.deduplicator.discard(doc.metadata["source"] for doc in docs)
+            raise
+
+    async def drain(self, return_exceptions: bool = True):
+        """Wait for all submitted batches.
+
+        Returns the errors of batches that failed since the last drain, or
+        raises the first of them when ``return_exceptions`` is false.
+        """
+        while self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        logger.debug("reference dedup: %s", self.deduplicator.stats())
+        errors, self._errors = self._errors, []
+        if errors and not return_exceptions:
+            raise errors[0]
+        return errors
@@ -0,0 +1,156 @@
+import asyncio
+import json
+import re
+import threading
+import unicodedata
+from functools import lru_cache
+from typing import List, Optional
+
+from langchain_core.documents import Document
+
+import conf.config as config
+from cache.search_cache import normalize_query
+from cache.sqlite_store import SQLiteKVStore
+from clients.registry import get_override, get_registry
+from metrics.recorder import get_metrics
+from scheduler.rate_limiter import Priority, get_scheduler
+
+
+def normalize_title(title: str) -> str:
+    """Title key that ignores case, width, underscores and punctuation."""
+    title = unicodedata.normalize("NFKC", title).casefold().replace("_", " ")
+    return " ".join(re.sub(r"[^\w\s]", " ", title).split())
+
+
+def _to_document(page: dict) -> Document:
+    return Document(
+        page_content=page["summary"],
+        metadata={
+            "title": page["title"],
+            "categories": page["categories"],
+            "source": page.get("url", ""),
+        },
+    )
+
+
+class WikipediaLookup:
+    """Resolves a subject to one Wikipedia page with only what perspective
+    generation uses: title, lead summary and visible categories.
+
+    Online lookups are a single async MediaWiki API request, cached on disk
+    with a TTL. With ``offline_dump`` (a JSON-lines file of
+    ``{"title", "summary", "categories"}``) no network is used at all; the
+    subject must then match a title exactly or after ``normalize_title``.
+    """
+
+    def __init__(
+        self,
+        cache: Optional[SQLiteKVStore] = None,
+        offline_dump: Optional[str] = None,
+        lang: str = "en",
+    ):
+        self.cache = cache
+        self.offline_dump = offline_dump
+        self.api_url = f"https://{lang}.wikipedia.org/w/api.php"
+        self._titles = None
+        self._normalized_titles = None
+        self._load_lock = threading.Lock()
+
+    def _load_offline(self):
+        with self._load_lock:
+            if self._titles is None:
+                titles, normalized = {}, {}
+                with open(self.offline_dump, encoding="utf-8") as f:
+                    for line in f:
+                        if line.strip():
+                            page = json.loads(line)
+                            titles[page["title"]] = page
+                            normalized.setdefault(normalize_title(page["title"]), page)
+                self._titles, self._normalized_titles = titles, normalized
+
+    async def _lookup_offline(self, subject: str) -> Optional[dict]:
+        if self._titles is None:
+            # ダンプは大きいので、読み込みはイベントループを塞がないようスレッドで行う
+            await asyncio.to_thread(self._load_offline)
+        subject = subject.strip()
+        if subject in self._titles:
+            return self._titles[subject]
+        return self._normalized_titles.get(normalize_title(subject))
+
+    async def _fetch(self, subject: str) -> Optional[dict]:
+        params = {
+            "action": "query",
+            "format": "json",
+            "formatversion": "2",
+            "generator": "search",
+            "gsrsearch": subject,
+            "gsrlimit": "1",
+            "prop": "extracts|categories|info",
+            "inprop": "url",
+            "exintro": "1",
+            "explaintext": "1",
+            "cllimit": "max",
+            "clshow": "!hidden",
+            "redirects": "1",
+        }
+        async with get_scheduler().slot("wikipedia", level=Priority.LOW):
+            response = await get_registry().http_async_client.get(
+                self.api_url,
+                params=params,
+                headers={"User-Agent": config.WIKIPEDIA_USER_AGENT},
+            )
+        response.raise_for_status()
+        pages = response.json().get("query", {}).get("pages", [])
+        if not pages:
+            return None
+        page = pages[0]
+        return {
+            "title": page["title"],
+            "summary": page.get("extract", ""),
+            "categories": [
+                c["title"].split(":", 1)[-1] for c in page.get("categories", [])
+            ],
+            "url": page.get("fullurl", ""),
+        }
+
+    async def aget(self, subject: str) -> List[Document]:
+        if self.offline_dump:
+            page = await self._lookup_offline(subject)
+            return [_to_document(page)] if page else []
+        key = normalize_query(subject)
+        with get_metrics().timed("wikipedia", "lookup") as fields:
+            cached = self.cache.get(key) if self.cache is not None else None
+            fields["cache_hit"] = cached is not None
+            if cached is None:
+                page = await self._fetch(subject)
+                cached = page or {"missing": True}
+                if self.cache is not None:
+                    self.cache.set(key, cached)
+            fields["payload_bytes"] = len(cached.get("summary", ""))
+        if cached.get("missing"):
+            return []
+        return [_to_document(cached)]
+
+    async def abatch(self, subjects: List[str], return_exceptions: bool = True):
+        return await asyncio.gather(
+            *(self.aget(subject) for subject in subjects),
+            return_exceptions=return_exceptions,
+        )
+
+
+def get_wikipedia_lookup():
+    return get_override("wikipedia") or _default_wikipedia_lookup()
+
+
+@lru_cache(maxsize=None)
+def _default_wikipedia_lookup() -> WikipediaLookup:
+    return WikipediaLookup(
+        cache=SQLiteKVStore(
+            config.WIKIPEDIA_CACHE_PATH,
+            table="wikipedia_pages",
+            ttl_seconds=config.WIKIPEDIA_CACHE_TTL_SECONDS,
+            max_entries=config.WIKIPEDIA_CACHE_MAX_ENTRIES,
+        ),
+        offline_dump=config.WIKIPEDIA_OFFLINE_DUMP or None,
+        lang=config.WIKIPEDIA_LANG,
+    )
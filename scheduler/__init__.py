@@ -0,0 +1,8 @@
+from .chat_model import ScheduledChatOpenAI, ScheduledEmbeddings
+from .rate_limiter import (
+    Priority,
+    ProviderLimits,
+    Scheduler,
+    get_scheduler,
+    priority,
+)
@@ -0,0 +1,163 @@
+from typing import Any, AsyncIterator, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun
+from langchain_core.embeddings import Embeddings
+from langchain_core.messages import AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from langchain_openai import ChatOpenAI
+from langchain_openai.chat_models.base import _convert_delta_to_message_chunk
+
+from metrics.recorder import get_metrics
+from .rate_limiter import get_scheduler
+
+
+class ScheduledChatOpenAI(ChatOpenAI):
+    """ChatOpenAI whose async calls wait for a slot in the global scheduler.
+
+    Cache hits never reach ``_agenerate`` and so do not use any budget.
+    Once a call finishes, the token budget is charged the difference between
+    the estimate and the reported usage.
+    """
+
+    provider: str = "openai"
+    stream_usage: bool = True
+    """Ask for a final usage chunk when streaming (``stream_options``)."""
+
+    def _estimate_tokens(self, messages: List[BaseMessage]) -> int:
+        try:
+            prompt_tokens = self.get_num_tokens_from_messages(messages)
+        except Exception:
+            prompt_tokens = sum(len(str(m.content)) for m in messages) // 4
+        return prompt_tokens + (self.max_tokens or 0)
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        estimate = self._estimate_tokens(messages)
+        provider = get_scheduler().provider(self.provider)
+        async with provider.slot(tokens=estimate):
+            result = await super()._agenerate(
+                messages, stop=stop, run_manager=run_manager, **kwargs
+            )
+        usage = (result.llm_output or {}).get("token_usage") or {}
+        provider.adjust_tokens(usage.get("total_tokens", estimate) - estimate)
+        return result
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        estimate = self._estimate_tokens(messages)
+        provider = get_scheduler().provider(self.provider)
+        usage = None
+        text = []
+        async with provider.slot(tokens=estimate):
+            try:
+                async for chunk in self._astream_with_usage(
+                    messages, stop=stop, run_manager=run_manager, **kwargs
+                ):
+                    usage = chunk.message.usage_metadata or usage
+                    text.append(chunk.text)
+                    yield chunk
+            finally:
+                if usage is not None:
+                    used = usage["total_tokens"]
+                else:
+                    # 使用量が返らないエンドポイントでは出力を数えて近似する
+                    used = estimate - (self.max_tokens or 0) + len("".join(text)) // 4
+                provider.adjust_tokens(used - estimate)
+
+    async def _astream_with_usage(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        # ChatOpenAI._astream (langchain-openai 0.1.7) と同じだが、choices が空の
+        # 最後の usage チャンクを捨てずに usage_metadata として返す
+        message_dicts, params = self._create_message_dicts(messages, stop)
+        params = {**params, **kwargs, "stream": True}
+        if self.stream_usage:
+            params["stream_options"] = {"include_usage": True}
+
+        default_chunk_class = AIMessageChunk
+        response = await self.async_client.create(messages=message_dicts, **params)
+        async with response:
+            async for chunk in response:
+                if not isinstance(chunk, dict):
+                    chunk = chunk.model_dump()
+                if usage := chunk.get("usage"):
+                    yield ChatGenerationChunk(
+                        message=AIMessageChunk(
+                            content="",
+                            usage_metadata={
+                                "input_tokens": usage["prompt_tokens"],
+                                "output_tokens": usage["completion_tokens"],
+                                "total_tokens": usage["total_tokens"],
+                            },
+                        )
+                    )
+                if len(chunk["choices"]) == 0:
+                    continue
+                choice = chunk["choices"][0]
+                if choice["delta"] is None:
+                    continue
+                chunk = _convert_delta_to_message_chunk(
+                    choice["delta"], default_chunk_class
+                )
+                generation_info = {}
+                if finish_reason := choice.get("finish_reason"):
+                    generation_info["finish_reason"] = finish_reason
+                logprobs = choice.get("logprobs")
+                if logprobs:
+                    generation_info["logprobs"] = logprobs
+                default_chunk_class = chunk.__class__
+                chunk = ChatGenerationChunk(
+                    message=chunk, generation_info=generation_info or None
+                )
+                if run_manager:
+                    await run_manager.on_llm_new_token(
+                        token=chunk.text, chunk=chunk, logprobs=logprobs
+                    )
+                yield chunk
+
+
+class ScheduledEmbeddings(Embeddings):
+    """Routes async embedding calls through the global scheduler."""
+
+    def __init__(self, underlying: Embeddings, provider: str = "openai_embeddings"):
+        self.underlying = underlying
+        self.provider = provider
+
+    @property
+    def model(self):
+        return getattr(self.underlying, "model", type(self.underlying).__name__)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.underlying.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.underlying.embed_query(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        tokens = sum(len(t) for t in texts) // 4
+        async with get_scheduler().slot(self.provider, tokens=tokens):
+            with get_metrics().timed(
+                "embedding",
+                self.model,
+                prompt_tokens=tokens,
+                payload_bytes=sum(len(t.encode("utf-8")) for t in texts),
+                batch_size=len(texts),
+            ):
+                return await self.underlying.aembed_documents(texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
@@ -0,0 +1,228 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
+from enum import IntEnum
+from functools import lru_cache
+from typing import Dict, Optional
+
+import conf.config as config
+from metrics.recorder import get_metrics
+
+
+class Priority(IntEnum):
+    CRITICAL = 0
+    HIGH = 1
+    NORMAL = 2
+    LOW = 3
+
+
+_current_priority = contextvars.ContextVar("storm_priority", default=Priority.NORMAL)
+
+
+@contextmanager
+def priority(level: Priority):
+    """Run outbound calls made inside this block (and tasks it spawns) at ``level``."""
+    token = _current_priority.set(level)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+@dataclass
+class ProviderLimits:
+    requests_per_minute: Optional[float] = None
+    tokens_per_minute: Optional[float] = None
+    max_in_flight: Optional[int] = None
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay_for(self, amount: float) -> float:
+        self._refill()
+        # 容量を超える要求はバケツが満杯になれば通す
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / self.rate)
+
+    def consume(self, amount: float):
+        self._refill()
+        self.level -= amount
+
+
+class ProviderScheduler:
+    """Admission control for one provider: request and token buckets, an
+    in-flight cap, and a priority queue in front of them."""
+
+    def __init__(self, name: str, limits: ProviderLimits):
+        self.name = name
+        self.limits = limits
+        self.requests = (
+            TokenBucket(limits.requests_per_minute)
+            if limits.requests_per_minute
+            else None
+        )
+        self.tokens = (
+            TokenBucket(limits.tokens_per_minute) if limits.tokens_per_minute else None
+        )
+        self.in_flight = 0
+        self.completed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._seq = itertools.count()
+        self._queue = []
+        self._loop = None
+        self._cond = None
+
+    def _condition(self) -> asyncio.Condition:
+        # Streamlit は実行ごとに新しいイベントループを作るのでループ単位で作り直す
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._cond = asyncio.Condition()
+            self._queue = []
+            self.in_flight = 0
+        return self._cond
+
+    def _delay(self, tokens: float) -> float:
+        delays = [0.0]
+        if self.requests:
+            delays.append(self.requests.delay_for(1))
+        if self.tokens and tokens:
+            delays.append(self.tokens.delay_for(tokens))
+        return max(delays)
+
+    def _publish(self):
+        metrics = get_metrics()
+        metrics.set_gauge(
+            "storm_scheduler_queue_depth", len(self._queue), provider=self.name
+        )
+        metrics.set_gauge(
+            "storm_scheduler_in_flight", self.in_flight, provider=self.name
+        )
+
+    def _has_capacity(self) -> bool:
+        return (
+            not self.limits.max_in_flight or self.in_flight < self.limits.max_in_flight
+        )
+
+    async def acquire(self, tokens: float = 0, level: Optional[Priority] = None):
+        cond = self._condition()
+        entry = (
+            level if level is not None else _current_priority.get(),
+            next(self._seq),
+        )
+        start = time.monotonic()
+        async with cond:
+            heapq.heappush(self._queue, entry)
+            depth = len(self._queue)
+            self._publish()
+            try:
+                while True:
+                    if self._queue[0] == entry and self._has_capacity():
+                        delay = self._delay(tokens)
+                        if delay <= 0:
+                            break
+                        try:
+                            await asyncio.wait_for(cond.wait(), delay)
+                        except asyncio.TimeoutError:
+                            pass
+                    else:
+                        await cond.wait()
+            except BaseException:
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+                self._publish()
+                cond.notify_all()
+                raise
+            heapq.heappop(self._queue)
+            if self.requests:
+                self.requests.consume(1)
+            if self.tokens and tokens:
+                self.tokens.consume(tokens)
+            self.in_flight += 1
+            self._publish()
+            cond.notify_all()
+        wait = time.monotonic() - start
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        # 待ち時間は storm_latency_seconds{kind="scheduler_wait"} に入る
+        get_metrics().record(
+            "scheduler_wait",
+            self.name,
+            wait,
+            queue_depth=depth,
+            priority=entry[0].name if isinstance(entry[0], Priority) else entry[0],
+        )
+
+    async def release(self):
+        cond = self._condition()
+        async with cond:
+            self.in_flight -= 1
+            self.completed += 1
+            self._publish()
+            cond.notify_all()
+
+    def adjust_tokens(self, delta: float):
+        """Charge (or refund) the difference between estimated and actual usage."""
+        if self.tokens and delta:
+            self.tokens.consume(delta)
+
+    @asynccontextmanager
+    async def slot(self, tokens: float = 0, level: Optional[Priority] = None):
+        await self.acquire(tokens, level)
+        try:
+            yield self
+        finally:
+            await self.release()
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": len(self._queue),
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "avg_wait_s": self.total_wait / self.completed if self.completed else 0.0,
+            "max_wait_s": self.max_wait,
+        }
+
+
+class Scheduler:
+    """Process-wide gate that every LLM, embedding, search and Wikipedia call
+    passes through."""
+
+    def __init__(self, limits: Dict[str, ProviderLimits]):
+        self.limits = limits
+        self.providers: Dict[str, ProviderScheduler] = {}
+
+    def provider(self, name: str) -> ProviderScheduler:
+        if name not in self.providers:
+            self.providers[name] = ProviderScheduler(
+                name, self.limits.get(name, ProviderLimits())
+            )
+        return self.providers[name]
+
+    def slot(self, provider: str, tokens: float = 0, level: Optional[Priority] = None):
+        return self.provider(provider).slot(tokens, level)
+
+    def stats(self) -> dict:
+        return {name: p.stats() for name, p in self.providers.items()}
+
+
+@lru_cache(maxsize=None)
+def get_scheduler() -> Scheduler:
+    return Scheduler(
+        {name: ProviderLimits(**limits) for name, limits in config.RATE_LIMITS.items()}
+    )
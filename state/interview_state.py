@@ -4,6 +4,7 @@ from langchain_core.messages import AnyMessage
 from langgraph.graph import END, StateGraph
 from typing_extensions import TypedDict
 from modules.generate_perspectives import Editor
+from retriever.reference_dedup import merge_references
 
 
 def add_messages(left, right):
@@ -17,8 +18,8 @@ def add_messages(left, right):
 def update_references(references, new_references):
     if not references:
         references = {}
-    references.update(new_references)
-    return references
+    # Same page behind tracking params / mobile hosts is kept once
+    return merge_references(references, new_references)
 
 
 def update_editor(editor, new_editor):
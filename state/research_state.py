@@ -1,13 +1,19 @@
-from typing import List, TypedDict
+from typing import Annotated, List, TypedDict
 from modules.generate_sections import WikiSection
 from modules.generate_initial_outline import Outline
 from modules.generate_perspectives import Editor
 from .interview_state import InterviewState
 
 
+def update_outline(outline, new_outline):
+    # init_research writes the first outline, refine_outline replaces it.
+    # A reducer also lets the graph fan out (see get_storm_graph).
+    return new_outline
+
+
 class ResearchState(TypedDict):
     topic: str
-    outline: Outline
+    outline: Annotated[Outline, update_outline]
     editors: List[Editor]
     interview_results: List[InterviewState]
     # The final sections output
@@ -0,0 +1,33 @@
+import os
+
+import numpy as np
+
+from cache.embedding_cache import EmbeddingStore
+
+
+def test_orphan_rows_without_index_are_skipped(tmp_path):
+    store = EmbeddingStore(str(tmp_path), "model")
+    store.put_many(["a"], np.array([[1.0, 1.0]]))
+    # 最初のインデックス行を書く前に落ちた状態
+    os.remove(store.index_path)
+
+    store = EmbeddingStore(str(tmp_path), "model")
+    store.put_many(["b"], np.array([[2.0, 2.0]]))
+    assert store.get_many(["b"])["b"].tolist() == [2.0, 2.0]
+    assert "a" not in store.get_many(["a"])
+
+
+def test_entries_from_another_store_are_picked_up(tmp_path):
+    first = EmbeddingStore(str(tmp_path), "model")
+    second = EmbeddingStore(str(tmp_path), "model")
+    first.put_many(["a"], np.array([[1.0, 1.0]]))
+    second.put_many(["b"], np.array([[2.0, 2.0]]))
+    first.put_many(["c"], np.array([[3.0, 3.0]]))
+
+    for store in (first, second, EmbeddingStore(str(tmp_path), "model")):
+        found = store.get_many(["a", "b", "c"])
+        assert {d: v.tolist() for d, v in found.items()} == {
+            "a": [1.0, 1.0],
+            "b": [2.0, 2.0],
+            "c": [3.0, 3.0],
+        }
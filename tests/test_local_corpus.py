@@ -0,0 +1,50 @@
+from retriever.local_corpus import LocalCorpusIndex
+
+
+def test_removed_ids_are_not_reused_after_reopen(tmp_path):
+    path = str(tmp_path / "index.sqlite")
+    index = LocalCorpusIndex(path)
+    index.add_documents((f"doc://{i}", f"filler text {i}") for i in range(20))
+    index.add_documents([("doc://zoo", "zebra giraffe")], source="zoo.txt")
+    index.commit()
+    index.remove_source("zoo.txt")
+    index.close()
+
+    index = LocalCorpusIndex(path)
+    index.add_documents([("doc://fruit", "completely unrelated apples")])
+    index.commit()
+    assert index.search("zebra") == []
+    assert [r["url"] for r in index.search("apples")] == ["doc://fruit"]
+    index.close()
+
+
+def test_compaction_only_after_new_tombstones(tmp_path, monkeypatch):
+    index = LocalCorpusIndex(str(tmp_path / "index.sqlite"))
+    index.add_documents((f"doc://{i}", f"word{i} common") for i in range(8))
+    index.add_documents(
+        ((f"doc://old{i}", "stale") for i in range(4)), source="old.txt"
+    )
+    index.commit()
+    index.remove_source("old.txt")
+
+    calls = []
+    compact = index.compact
+    monkeypatch.setattr(index, "compact", lambda: calls.append(1) or compact())
+    index.commit()
+    index.commit()
+    assert len(calls) == 1
+    assert "stale" not in index._postings
+    index.close()
+
+
+def test_duplicate_urls_in_one_batch_and_zero_k(tmp_path):
+    index = LocalCorpusIndex(str(tmp_path / "index.sqlite"))
+    added = index.add_documents(
+        [("doc://a", "first draft"), ("doc://a", "final text"), ("doc://b", "other")]
+    )
+    index.commit()
+    assert added == 2
+    assert index.search("draft") == []
+    assert [r["url"] for r in index.search("final")] == ["doc://a"]
+    assert index.search("final", k=0) == []
+    index.close()